@@ -1,45 +1,99 @@
-from collections import OrderedDict
+from flask import Flask, Response, jsonify, stream_with_context
 
-from flask import Flask
-
-from combined import CombinedMessageSchema
+from batch import (
+    BATCH_TAGGERS,
+    STREAM_TAGGERS,
+    build_batch_result,
+    stream_tagged_documents,
+)
+import compress
+from combined import (
+    CombinedMessageSchema,
+    build_combined_result,
+    get_combined_predictions,
+)
 from concepts import (
+    CONCEPTS_PREDICTOR,
     get_concept_predictions,
     ConceptsMessageSchema,
+    build_concepts_result,
     format_concepts,
     get_concepts_from_api,
 )
+from http_cache import conditional
 from keywords import (
+    KEYWORDS_PREDICTOR,
     get_keywords_predictions,
     get_keywords_from_api,
+    build_keywords_result,
     format_keywords,
     KeywordsMessageSchema,
 )
+import metrics
+from serialize import json_response, rows_response
+import timing
+from timing import span
 from topics import (
+    TOPICS_PREDICTOR,
     get_topic_predictions,
     TopicsMessageSchema,
+    build_topics_result,
     format_topics,
     get_topics_from_api,
 )
 
-from oql import(
-    get_openai_response
+from utils import (
+    ROUTE_GROUPS,
+    get_batch_works,
+    get_request_lines,
+    get_title_and_abstract,
+    get_work_title_and_abstract,
+    get_natural_language_text,
+    get_related_to_text,
+    get_response_format,
 )
-
-from related_to_text import(
-    get_similar_works,
-    get_similar_authors,
-    connect_to_db
+from validate import (
+    validate_batch_input,
+    validate_input,
+    validate_natural_language,
+    validate_response_format,
 )
-
-from utils import get_title_and_abstract, get_natural_language_text, get_related_to_text
-from validate import validate_input, validate_natural_language
+import warmup
 
 app = Flask(__name__)
 app.json.sort_keys = False
+metrics.init_app(app)
+timing.init_app(app)
+# Registered after timing so its span lands in the Server-Timing header.
+compress.init_app(app)
+warmup.init_app(app)
+
+
+def route(group, rule, **options):
+    """app.route, for a route of the given group; disabled groups' routes 404."""
+
+    def decorator(view):
+        if group in ROUTE_GROUPS:
+            return app.route(rule, **options)(view)
+        return view
+
+    return decorator
+
+
+def embedding_model():
+    # Imported on first use so tagging-only workers never load it.
+    from related_to_text import EMBEDDING_MODEL
+
+    return EMBEDDING_MODEL
 
 
-@app.route("/text", methods=["GET", "POST"])
+@route("tagging", "/text", methods=["GET", "POST"])
+@conditional(
+    get_title_and_abstract,
+    CONCEPTS_PREDICTOR.model_id,
+    KEYWORDS_PREDICTOR.model_id,
+    TOPICS_PREDICTOR.model_id,
+)
 def combined_view():
     title, abstract = get_title_and_abstract()
 
@@ -47,38 +101,19 @@ def combined_view():
     if invalid_response:
         return invalid_response
 
-    concept_predictions = get_concept_predictions(title, abstract)
-    concept_ids = [f"C{concept_id}" for concept_id, _ in concept_predictions]
-    concepts_from_api = get_concepts_from_api(concept_ids)
-    formatted_concepts = format_concepts(concept_predictions, concepts_from_api)
+    formatted_keywords, formatted_topics, formatted_concepts = get_combined_predictions(
+        title, abstract
+    )
 
-    keywords_predictions = get_keywords_predictions(title, abstract)
-    keyword_ids = [
-        f"keywords/{keyword['keyword_id']}" for keyword in keywords_predictions
-    ]
-    keywords_from_api = get_keywords_from_api(keyword_ids)
-    formatted_keywords = format_keywords(keywords_predictions, keywords_from_api)
+    result = build_combined_result(
+        formatted_keywords, formatted_topics, formatted_concepts
+    )
+    with span("serialization"):
+        return json_response(result, CombinedMessageSchema)
 
-    topic_predictions = get_topic_predictions(title, abstract)
-    topic_ids = [f"T{topic['topic_id']}" for topic in topic_predictions]
-    topics_from_api = get_topics_from_api(topic_ids)
-    formatted_topics = format_topics(topic_predictions, topics_from_api)
-
-    result = OrderedDict()
-    result["meta"] = {
-        "keywords_count": len(formatted_keywords),
-        "topics_count": len(formatted_topics),
-        "concepts_count": len(formatted_concepts),
-    }
-    result["keywords"] = formatted_keywords
-    result["primary_topic"] = formatted_topics[0] if formatted_topics else None
-    result["topics"] = formatted_topics
-    result["concepts"] = formatted_concepts
-    message_schema = CombinedMessageSchema()
-    return message_schema.dump(result)
-
-
-@app.route("/text/concepts", methods=["GET", "POST"])
+
+@route("tagging", "/text/concepts", methods=["GET", "POST"])
+@conditional(get_title_and_abstract, CONCEPTS_PREDICTOR.model_id)
 def concepts():
     title, abstract = get_title_and_abstract()
 
@@ -89,18 +124,16 @@ def concepts():
     concept_predictions = get_concept_predictions(title, abstract)
     concept_ids = [f"C{concept_id}" for concept_id, _ in concept_predictions]
     concepts_from_api = get_concepts_from_api(concept_ids)
-    formatted_concepts = format_concepts(concept_predictions, concepts_from_api)
+    with span("concepts-formatting"):
+        formatted_concepts = format_concepts(concept_predictions, concepts_from_api)
 
-    result = OrderedDict()
-    result["meta"] = {
-        "count": len(formatted_concepts),
-    }
-    result["concepts"] = formatted_concepts
-    message_schema = ConceptsMessageSchema()
-    return message_schema.dump(result)
+    result = build_concepts_result(formatted_concepts)
+    with span("serialization"):
+        return json_response(result, ConceptsMessageSchema)
 
 
-@app.route("/text/keywords", methods=["GET", "POST"])
+@route("tagging", "/text/keywords", methods=["GET", "POST"])
+@conditional(get_title_and_abstract, KEYWORDS_PREDICTOR.model_id)
 def keywords():
     title, abstract = get_title_and_abstract()
 
@@ -113,18 +146,16 @@ def keywords():
         f"keywords/{keyword['keyword_id']}" for keyword in keyword_predictions
     ]
     keywords_from_api = get_keywords_from_api(keyword_ids)
-    formatted_keywords = format_keywords(keyword_predictions, keywords_from_api)
+    with span("keywords-formatting"):
+        formatted_keywords = format_keywords(keyword_predictions, keywords_from_api)
 
-    result = OrderedDict()
-    result["meta"] = {
-        "count": len(formatted_keywords),
-    }
-    result["keywords"] = formatted_keywords
-    message_schema = KeywordsMessageSchema()
-    return message_schema.dump(result)
+    result = build_keywords_result(formatted_keywords)
+    with span("serialization"):
+        return json_response(result, KeywordsMessageSchema)
 
 
-@app.route("/text/topics", methods=["GET", "POST"])
+@route("tagging", "/text/topics", methods=["GET", "POST"])
+@conditional(get_title_and_abstract, TOPICS_PREDICTOR.model_id)
 def topics():
     title, abstract = get_title_and_abstract()
 
@@ -135,18 +166,46 @@ def topics():
     topic_predictions = get_topic_predictions(title, abstract)
     topic_ids = [f"T{topic['topic_id']}" for topic in topic_predictions]
     topics_from_api = get_topics_from_api(topic_ids)
-    formatted_topics = format_topics(topic_predictions, topics_from_api)
-
-    result = OrderedDict()
-    result["meta"] = {
-        "count": len(formatted_topics),
-    }
-    result["primary_topic"] = formatted_topics[0] if formatted_topics else None
-    result["topics"] = formatted_topics
-    message_schema = TopicsMessageSchema()
-    return message_schema.dump(result)
-
-@app.route("/text/oql", methods=["GET", "POST"])
+    with span("topics-formatting"):
+        formatted_topics = format_topics(topic_predictions, topics_from_api)
+
+    result = build_topics_result(formatted_topics)
+    with span("serialization"):
+        return json_response(result, TopicsMessageSchema)
+
+
+@route("tagging", "/text/batch", methods=["POST"], defaults={"tagger": "combined"})
+@route("tagging", "/text/batch/<tagger>", methods=["POST"])
+def batch_view(tagger):
+    if tagger not in BATCH_TAGGERS:
+        return jsonify({"error": f"Unknown tagger '{tagger}'"}), 404
+
+    works = get_batch_works()
+
+    invalid_response = validate_batch_input(works)
+    if invalid_response:
+        return invalid_response
+
+    documents = [get_work_title_and_abstract(work) for work in works]
+    tag_documents, message_schema_class = BATCH_TAGGERS[tagger]
+    result = build_batch_result(tag_documents(documents))
+    with span("serialization"):
+        return json_response(result, message_schema_class)
+
+
+@route("tagging", "/text/stream", methods=["POST"], defaults={"tagger": "combined"})
+@route("tagging", "/text/stream/<tagger>", methods=["POST"])
+def stream_view(tagger):
+    if tagger not in STREAM_TAGGERS:
+        return jsonify({"error": f"Unknown tagger '{tagger}'"}), 404
+
+    lines = get_request_lines()
+    return Response(
+        stream_with_context(stream_tagged_documents(lines, tagger)),
+        mimetype="application/x-ndjson",
+    )
+
+@route("oql", "/text/oql", methods=["GET", "POST"])
 def get_oql_json_object():
     natural_language_text = get_natural_language_text()
 
@@ -154,28 +213,48 @@ def get_oql_json_object():
     if invalid_response:
         return invalid_response
     
+    from oql import get_openai_response
+
     openai_response = get_openai_response(natural_language_text.strip())
     return openai_response
 
-@app.route("/text/related-works", methods=["GET", "POST"])
+@route("related", "/text/related-works", methods=["GET", "POST"])
+@conditional(lambda: (get_related_to_text(), None), embedding_model, get_response_format)
 def get_works_related_to_text():
+    from related_to_text import connect_to_db, get_similar_works
+
     related_to_text = get_related_to_text()
+    response_format = get_response_format()
+
+    invalid_response = validate_response_format(response_format)
+    if invalid_response:
+        return invalid_response
 
     conn = connect_to_db()
     works_list = get_similar_works(conn, related_to_text, 0.35, topK = 1000)
     conn.close()
-    
-    return works_list
 
-@app.route("/text/related-authors", methods=["GET", "POST"])
+    with span("serialization"):
+        return rows_response(works_list, "work_id", response_format)
+
+@route("related", "/text/related-authors", methods=["GET", "POST"])
+@conditional(lambda: (get_related_to_text(), None), embedding_model, get_response_format)
 def get_authors_related_to_text():
+    from related_to_text import connect_to_db, get_similar_authors
+
     related_to_text = get_related_to_text()
+    response_format = get_response_format()
+
+    invalid_response = validate_response_format(response_format)
+    if invalid_response:
+        return invalid_response
 
     conn = connect_to_db()
     authors_list = get_similar_authors(conn, related_to_text, 0.5, topK = 5000)
     conn.close()
-    
-    return authors_list
+
+    with span("serialization"):
+        return rows_response(authors_list, "author_id", response_format)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+from collections import OrderedDict
+from itertools import islice
+import json
+
+from marshmallow import Schema, fields
+
+from combined import (
+    CombinedMessageSchema,
+    build_combined_result,
+    get_combined_predictions_batch,
+    tag_concepts_batch,
+    tag_keywords_batch,
+    tag_topics_batch,
+)
+from concepts import ConceptsMessageSchema, build_concepts_result
+from keywords import KeywordsMessageSchema, build_keywords_result
+from serialize import compile_schema, to_json
+from topics import TopicsMessageSchema, build_topics_result
+from utils import MODEL_BATCH_SIZE, get_work_title_and_abstract
+from validate import get_work_error
+
+
+def tag_combined_documents(documents):
+    return [
+        build_combined_result(*predictions)
+        for predictions in get_combined_predictions_batch(documents)
+    ]
+
+
+def tag_concepts_documents(documents):
+    return [
+        build_concepts_result(formatted_concepts)
+        for formatted_concepts in tag_concepts_batch(documents)
+    ]
+
+
+def tag_keywords_documents(documents):
+    return [
+        build_keywords_result(formatted_keywords)
+        for formatted_keywords in tag_keywords_batch(documents)
+    ]
+
+
+def tag_topics_documents(documents):
+    return [
+        build_topics_result(formatted_topics)
+        for formatted_topics in tag_topics_batch(documents)
+    ]
+
+
+def build_batch_result(results):
+    result = OrderedDict()
+    result["meta"] = {
+        "count": len(results),
+    }
+    result["results"] = results
+    return result
+
+
+def stream_tagged_documents(lines, tagger):
+    """
+    Tag a JSON-lines body one MODEL_BATCH_SIZE chunk at a time and yield one
+    JSON line per input line, in input order, as soon as its chunk has been
+    tagged. Only the current chunk is ever held in memory.
+    """
+    tag_documents, message_schema_class = STREAM_TAGGERS[tagger]
+    project = compile_schema(message_schema_class)
+    lines = (line for line in lines if line.strip())
+
+    while True:
+        lines_chunk = list(islice(lines, MODEL_BATCH_SIZE))
+        if not lines_chunk:
+            return
+
+        outputs = [None] * len(lines_chunk)
+        positions = []
+        documents = []
+        for i, line in enumerate(lines_chunk):
+            try:
+                work = json.loads(line)
+            except ValueError:
+                outputs[i] = {"error": "Each line must be a JSON object"}
+                continue
+
+            error = get_work_error(work)
+            if error:
+                outputs[i] = {"error": error}
+            else:
+                positions.append(i)
+                documents.append(get_work_title_and_abstract(work))
+
+        if documents:
+            # A failed chunk (e.g. the OpenAlex API being down) gets an error
+            # line per input rather than cutting the stream off.
+            try:
+                results = [project(result) for result in tag_documents(documents)]
+            except Exception as e:
+                print(f"Error tagging stream chunk: {e}")
+                results = [{"error": "Tagging failed"}] * len(documents)
+            for i, output in zip(positions, results):
+                outputs[i] = output
+
+        for output in outputs:
+            yield to_json(output) + b"\n"
+
+
+class MetaSchema(Schema):
+    count = fields.Int()
+
+    class Meta:
+        ordered = True
+
+
+class CombinedBatchMessageSchema(Schema):
+    meta = fields.Nested(MetaSchema)
+    results = fields.Nested(CombinedMessageSchema, many=True)
+
+    class Meta:
+        ordered = True
+
+
+class ConceptsBatchMessageSchema(Schema):
+    meta = fields.Nested(MetaSchema)
+    results = fields.Nested(ConceptsMessageSchema, many=True)
+
+    class Meta:
+        ordered = True
+
+
+class KeywordsBatchMessageSchema(Schema):
+    meta = fields.Nested(MetaSchema)
+    results = fields.Nested(KeywordsMessageSchema, many=True)
+
+    class Meta:
+        ordered = True
+
+
+class TopicsBatchMessageSchema(Schema):
+    meta = fields.Nested(MetaSchema)
+    results = fields.Nested(TopicsMessageSchema, many=True)
+
+    class Meta:
+        ordered = True
+
+
+BATCH_TAGGERS = {
+    "combined": (tag_combined_documents, CombinedBatchMessageSchema),
+    "concepts": (tag_concepts_documents, ConceptsBatchMessageSchema),
+    "keywords": (tag_keywords_documents, KeywordsBatchMessageSchema),
+    "topics": (tag_topics_documents, TopicsBatchMessageSchema),
+}
+
+STREAM_TAGGERS = {
+    "combined": (tag_combined_documents, CombinedMessageSchema),
+    "concepts": (tag_concepts_documents, ConceptsMessageSchema),
+    "keywords": (tag_keywords_documents, KeywordsMessageSchema),
+    "topics": (tag_topics_documents, TopicsMessageSchema),
+}
@@ -0,0 +1,73 @@
+"""
+The API with Postgres replaced by an in-memory fake, for benchmarking
+against the upstream stubs. Point the other upstreams at the stubs through
+the environment (see bench.stubs.upstream_env) before starting it:
+
+    python -m bench.app_server --port 8901
+    gunicorn -w 4 bench.app_server:app
+
+BENCH_DB_LATENCY (seconds per query) and BENCH_DB_ROWS (rows the vector
+search returns before the LIMIT) shape the fake vector store.
+"""
+import argparse
+import os
+import random
+import time
+
+import related_to_text
+import app as app_module
+
+DB_LATENCY = float(os.getenv("BENCH_DB_LATENCY", 0.02))
+DB_ROWS = int(os.getenv("BENCH_DB_ROWS", 2000))
+
+
+class FakeCursor:
+    def __init__(self):
+        self.rows = []
+
+    def execute(self, query, params):
+        # (embedding, embedding, threshold, embedding, limit)
+        embedding, _, threshold, _, limit = params
+        rng = random.Random(hash(tuple(embedding[:8])))
+        time.sleep(DB_LATENCY)
+        self.rows = sorted(
+            (
+                (rng.randint(1, 10**9), rng.uniform(0, threshold))
+                for _ in range(min(limit, DB_ROWS))
+            ),
+            key=lambda row: row[1],
+        )
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def cursor(self):
+        return FakeCursor()
+
+    def close(self):
+        pass
+
+
+def connect_to_fake_db():
+    return FakeConnection()
+
+
+related_to_text.connect_to_db = connect_to_fake_db
+related_to_text.register_vector = lambda conn: None
+app = app_module.app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API against the stubs.")
+    parser.add_argument("--port", type=int, default=8901)
+    args = parser.parse_args()
+    app.run(host="127.0.0.1", port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Measure the import cost of booting a worker for each ROUTE_GROUPS
+configuration: `import app` plus the modules its enabled routes import on
+first use. Each run is a fresh interpreter with warm-up disabled, so the
+numbers are the imports alone; the bare interpreter start-up is shown for
+reference and the slowest modules come from `python -X importtime`.
+
+    python -m bench.import_time --repeat 5 --top 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+CONFIGURATIONS = {
+    "tagging": "tagging",
+    "tagging+oql": "tagging,oql",
+    "all": "tagging,oql,related",
+}
+# What each group's routes import on first use.
+GROUP_MODULES = {
+    "oql": ["oql"],
+    "related": ["related_to_text"],
+}
+
+
+def import_code(route_groups):
+    modules = ["app"]
+    for group in route_groups.split(","):
+        modules += GROUP_MODULES.get(group, [])
+    return "; ".join(f"import {module}" for module in modules)
+
+
+def run_python(route_groups, *args):
+    return subprocess.run(
+        [sys.executable, *args],
+        env={**os.environ, "ROUTE_GROUPS": route_groups, "WARMUP": "0"},
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+
+def time_import(route_groups, code):
+    start = time.perf_counter()
+    run_python(route_groups, "-c", code)
+    return time.perf_counter() - start
+
+
+def slowest_imports(route_groups, top):
+    """(cumulative seconds, module) of the slowest imports two levels deep."""
+    result = run_python(route_groups, "-X", "importtime", "-c", import_code(route_groups))
+    imports = []
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package", nested
+        # imports indented two more spaces per level.
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if len(name) - len(name.lstrip()) <= 3:
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app import time.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = {"(interpreter)": ("", "pass")}
+    for name, route_groups in CONFIGURATIONS.items():
+        runs[name] = (route_groups, import_code(route_groups))
+
+    print(f"{'route groups':<14}{'best s':>9}{'median s':>10}")
+    for name, (route_groups, code) in runs.items():
+        times = sorted(time_import(route_groups, code) for _ in range(args.repeat))
+        print(f"{name:<14}{times[0]:>9.3f}{times[len(times) // 2]:>10.3f}")
+
+    for name, route_groups in CONFIGURATIONS.items():
+        print()
+        print(f"slowest imports ({name})")
+        for seconds, module in slowest_imports(route_groups, args.top):
+            print(f"  {seconds:>7.3f}s  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Replay a log of real requests against the API, at the original rate or
+scaled up, and report latency, errors and upstream calls per request type.
+
+    python -m bench.replay requests.jsonl                 # original rate
+    python -m bench.replay requests.jsonl --speed 5       # 5x faster
+    python -m bench.replay requests.jsonl --speed 0       # as fast as possible
+    python -m bench.replay requests.jsonl --url http://staging:5000
+
+The log has one JSON object per line:
+
+    {"timestamp": "2024-09-01T12:00:00.250Z", "method": "GET",
+     "path": "/text/topics", "title": "...", "abstract": "..."}
+
+`timestamp` is ISO 8601 or epoch seconds; `method` defaults to GET; the
+`title`, `abstract`, `natural_language` and `text` params may be top-level
+or under "params". /text/batch and /text/stream requests need their
+documents, as a `works` list or the raw request `body` string:
+
+    {"timestamp": 12.5, "method": "POST", "path": "/text/stream/topics",
+     "works": [{"title": "...", "abstract": "..."}, ...]}
+
+and are skipped, with a note, without them. Without --url the stubs and the API are started locally
+as in bench.run. Upstream calls are attributed to each request from the
+"upstream-*" spans in its Server-Timing header, one per network call;
+streamed (/text/stream) requests send that header before doing any work,
+so no calls are reported for them.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import json
+import re
+import threading
+import time
+
+import requests
+
+from bench.run import print_report, route_group, running_stack, summarize
+from bench.stubs import add_stub_arguments
+
+REQUEST_PARAMS = ("title", "abstract", "natural_language", "text")
+
+# The Server-Timing span recorded around each call to an upstream.
+UPSTREAM_SPAN_PREFIX = "upstream-"
+# Streamed responses send their headers before any work runs, so their
+# upstream calls can't be attributed.
+STREAMED_PATH_PREFIX = "/text/stream"
+# Routes whose body is a list of works rather than request params.
+WORKS_PATH_PREFIXES = ("/text/batch", STREAMED_PATH_PREFIX)
+
+
+def parse_timestamp(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def read_log(path):
+    entries = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            params = dict(record.get("params") or {})
+            params.update((key, record[key]) for key in REQUEST_PARAMS if key in record)
+            entries.append(
+                {
+                    "timestamp": parse_timestamp(record["timestamp"]),
+                    "method": record.get("method", "GET").upper(),
+                    "path": record["path"],
+                    "params": params,
+                    "works": record.get("works"),
+                    "body": record.get("body"),
+                }
+            )
+    entries.sort(key=lambda entry: entry["timestamp"])
+    return entries
+
+
+def request_kwargs(entry):
+    """The requests arguments that resend a logged request's input."""
+    if entry["body"] is not None:
+        content_type = (
+            "application/x-ndjson"
+            if entry["path"].startswith(STREAMED_PATH_PREFIX)
+            else "application/json"
+        )
+        return {"data": entry["body"].encode(), "headers": {"Content-Type": content_type}}
+    if entry["path"].startswith(STREAMED_PATH_PREFIX):
+        body = "\n".join(json.dumps(work) for work in entry["works"])
+        return {"data": body.encode(), "headers": {"Content-Type": "application/x-ndjson"}}
+    if entry["path"].startswith(WORKS_PATH_PREFIXES):
+        return {"json": {"works": entry["works"]}}
+    if entry["method"] == "GET":
+        return {"params": entry["params"]}
+    return {"json": entry["params"]}
+
+
+def replayable(entry):
+    return not entry["path"].startswith(WORKS_PATH_PREFIXES) or (
+        entry["works"] is not None or entry["body"] is not None
+    )
+
+
+def request_type(path):
+    return path.removeprefix("/text").strip("/") or "text"
+
+
+def upstream_calls(server_timing):
+    calls = {}
+    names = set()
+    for entry in server_timing.split(","):
+        name = entry.split(";")[0].strip()
+        # Repeats of a span are numbered "<name>-2", "<name>-3", ...
+        repeated = re.fullmatch(r"(.+)-\d+", name)
+        if repeated and repeated.group(1) in names:
+            name = repeated.group(1)
+        names.add(name)
+        if name.startswith(UPSTREAM_SPAN_PREFIX):
+            upstream = name.removeprefix(UPSTREAM_SPAN_PREFIX)
+            calls[upstream] = calls.get(upstream, 0) + 1
+    return calls
+
+
+def duplicate_share(entries):
+    seen = set()
+    duplicates = 0
+    for entry in entries:
+        key = (entry["path"], json.dumps(request_kwargs(entry), sort_keys=True, default=str))
+        duplicates += key in seen
+        seen.add(key)
+    return duplicates / len(entries) if entries else 0
+
+
+def replay(api_url, entries, speed, max_concurrency):
+    results = []
+    lags = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def send(entry):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        kwargs = request_kwargs(entry)
+        start = time.perf_counter()
+        try:
+            r = session.request(entry["method"], api_url + entry["path"], timeout=120, **kwargs)
+            r.content
+            ok = r.status_code < 400
+            calls = (
+                None
+                if entry["path"].startswith(STREAMED_PATH_PREFIX)
+                else upstream_calls(r.headers.get("Server-Timing", ""))
+            )
+        except requests.RequestException:
+            ok = False
+            calls = {}
+        with lock:
+            results.append((request_type(entry["path"]), time.perf_counter() - start, ok, calls))
+
+    # Requests wait for a free slot rather than queueing in the executor, so
+    # an overloaded API shows up as lag instead of being hidden by it.
+    slots = threading.BoundedSemaphore(max_concurrency)
+
+    def send_and_release(entry):
+        try:
+            send(entry)
+        finally:
+            slots.release()
+
+    first = entries[0]["timestamp"]
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        start = time.perf_counter()
+        for entry in entries:
+            due = start + (entry["timestamp"] - first) / speed if speed else start
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            slots.acquire()
+            if speed:
+                lags.append(time.perf_counter() - due)
+            executor.submit(send_and_release, entry)
+    elapsed = time.perf_counter() - start
+    return results, elapsed, lags
+
+
+def summarize_replay(results, elapsed):
+    by_type = {}
+    for kind, latency, ok, calls in results:
+        by_type.setdefault(kind, []).append((latency, ok, calls))
+
+    summaries = {}
+    for kind, rows in sorted(by_type.items()):
+        totals = {}
+        for _, _, calls in rows:
+            if calls is None:
+                totals = None
+                break
+            for upstream, count in calls.items():
+                totals[upstream] = totals.get(upstream, 0) + count
+        summaries[kind] = summarize(
+            [latency for latency, _, _ in rows],
+            sum(1 for _, ok, _ in rows if not ok),
+            elapsed,
+            totals,
+        )
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay logged requests against the API.")
+    parser.add_argument("log", help="JSON-lines request log")
+    parser.add_argument("--speed", type=float, default=1.0, help="rate multiplier; 0 sends as fast as possible")
+    parser.add_argument("--max-concurrency", type=int, default=64, help="cap on requests in flight")
+    parser.add_argument("--limit", type=int, help="only replay the first N requests")
+    parser.add_argument("--url", help="replay against a running API instead of starting one")
+    parser.add_argument("--workers", type=int, default=0, help="gunicorn workers when starting the API")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier replay to compare against")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    entries = read_log(args.log)[: args.limit]
+    skipped = [entry for entry in entries if not replayable(entry)]
+    if skipped:
+        # Replaying them with an empty body would only report errors the
+        # logged traffic never had.
+        print(f"Skipping {len(skipped)} batch/stream requests logged without works or body")
+        entries = [entry for entry in entries if replayable(entry)]
+    if not entries:
+        parser.error("the log has no requests")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["routes"]
+
+    if args.url:
+        results, elapsed, lags = replay(args.url.rstrip("/"), entries, args.speed, args.max_concurrency)
+    else:
+        route_groups = {route_group(request_type(entry["path"])) for entry in entries}
+        with running_stack(args, route_groups) as (api_url, stub_url):
+            results, elapsed, lags = replay(api_url, entries, args.speed, args.max_concurrency)
+
+    summaries = summarize_replay(results, elapsed)
+    print(
+        f"Replayed {len(entries)} requests in {elapsed:.1f}s "
+        f"({len(entries) / elapsed:.1f} req/s), {duplicate_share(entries):.0%} duplicates"
+    )
+    if lags and max(lags) > 0.1:
+        print(f"Sending fell behind schedule by up to {max(lags):.2f}s; raise --max-concurrency")
+    print_report(summaries, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "routes": summaries}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Offline benchmark: starts the upstream stubs and the API (with a fake
+vector store), drives each route at a fixed concurrency and reports
+throughput, latency percentiles and upstream calls per request.
+
+    python -m bench.run --routes text,topics,oql --requests 300 --concurrency 16
+    python -m bench.run --output before.json
+    python -m bench.run --baseline before.json      # after a change
+
+Runs start with empty prediction, name and config caches.
+--distinct-documents controls how often inputs repeat (lower it to
+measure cache and coalescing wins).
+The related-* routes count tokens with tiktoken, which downloads its
+encoding on first use; set TIKTOKEN_CACHE_DIR to run fully offline.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from bench.stubs import add_stub_arguments, upstream_env
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = (
+    "protein cell model network learning climate soil river urban health policy "
+    "quantum graph neural patient cancer gene expression market labour energy "
+    "carbon polymer catalyst synthesis thermal optical sensor imaging brain "
+    "memory language children school survey trial vaccine infection bacteria "
+    "enzyme membrane crystal surface fluid turbulence galaxy star planet ocean "
+    "forest species evolution population migration income tax trade finance"
+).split()
+
+BATCH_SIZE = 50
+
+
+def make_documents(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        (
+            " ".join(rng.choices(WORDS, k=rng.randint(6, 14))).capitalize(),
+            " ".join(rng.choices(WORDS, k=rng.randint(60, 140))).capitalize() + ".",
+        )
+        for _ in range(count)
+    ]
+
+
+def make_prompts(count, seed=0):
+    rng = random.Random(seed)
+    templates = [
+        "works from {} about {} published in {}",
+        "most cited works on {} and {} since {}",
+        "authors at {} working on {} after {}",
+    ]
+    return [
+        rng.choice(templates).format(
+            f"university of {rng.choice(WORDS)}", rng.choice(WORDS), rng.randint(1990, 2024)
+        )
+        for _ in range(count)
+    ]
+
+
+def text_request(path):
+    def build(i, documents, prompts):
+        title, abstract = documents[i % len(documents)]
+        return "GET", path, {"params": {"title": title, "abstract": abstract}}
+
+    return build
+
+
+def batch_request(path):
+    def build(i, documents, prompts):
+        works = [
+            {"title": title, "abstract": abstract}
+            for title, abstract in (
+                documents[(i * BATCH_SIZE + j) % len(documents)] for j in range(BATCH_SIZE)
+            )
+        ]
+        if path.startswith("/text/stream"):
+            body = "\n".join(json.dumps(work) for work in works)
+            return "POST", path, {"data": body, "headers": {"Content-Type": "application/x-ndjson"}}
+        return "POST", path, {"json": {"works": works}}
+
+    return build
+
+
+def oql_request(i, documents, prompts):
+    return "GET", "/text/oql", {"params": {"natural_language": prompts[i % len(prompts)]}}
+
+
+def related_request(path):
+    def build(i, documents, prompts):
+        title, abstract = documents[i % len(documents)]
+        return "GET", path, {"params": {"text": f"{title}. {abstract}"}}
+
+    return build
+
+
+ROUTES = {
+    "text": text_request("/text"),
+    "concepts": text_request("/text/concepts"),
+    "keywords": text_request("/text/keywords"),
+    "topics": text_request("/text/topics"),
+    "batch": batch_request("/text/batch"),
+    "stream": batch_request("/text/stream"),
+    "oql": oql_request,
+    "related-works": related_request("/text/related-works"),
+    "related-authors": related_request("/text/related-authors"),
+}
+
+
+def route_group(route):
+    if route == "oql":
+        return "oql"
+    if route.startswith("related-"):
+        return "related"
+    return "tagging"
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed, upstream_calls=None):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    summary = {
+        "requests": count,
+        "errors": errors,
+        "error_rate": round(errors / count, 4) if count else 0,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else None,
+    }
+    for p in (50, 95, 99):
+        value = percentile(latencies, p)
+        summary[f"p{p}_ms"] = round(value * 1000, 1) if value is not None else None
+    if upstream_calls is not None:
+        summary["upstream_calls_per_request"] = {
+            name: round(calls / count, 2) for name, calls in sorted(upstream_calls.items())
+        } if count else {}
+    return summary
+
+
+def send(session, base_url, method, path, kwargs):
+    start = time.perf_counter()
+    try:
+        r = session.request(method, base_url + path, timeout=120, **kwargs)
+        r.content
+        ok = r.status_code < 400
+    except requests.RequestException:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run_route(base_url, stub_url, route, count, concurrency, documents, prompts, warmup):
+    build = ROUTES[route]
+    sessions = {}
+
+    def worker(i):
+        session = sessions.setdefault(i % concurrency, requests.Session())
+        return send(session, base_url, *build(i, documents, prompts))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(count, count + warmup)))
+        requests.post(f"{stub_url}/calls/reset")
+        start = time.perf_counter()
+        results = list(executor.map(worker, range(count)))
+        elapsed = time.perf_counter() - start
+
+    upstream_calls = requests.get(f"{stub_url}/calls").json()
+    latencies = [latency for latency, _ in results]
+    errors = sum(1 for _, ok in results if not ok)
+    return summarize(latencies, errors, elapsed, upstream_calls)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with {process.returncode}")
+        try:
+            if requests.get(url, timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+def process_tree(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        return [pid]
+    return [pid, *(p for child in children for p in process_tree(child))]
+
+
+def print_memory(pid):
+    """RSS and PSS (shared pages split between sharers) per API process; Linux only."""
+    for process_pid in process_tree(pid):
+        try:
+            with open(f"/proc/{process_pid}/smaps_rollup") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            return
+        rss, pss = (int(fields[key].split()[0]) // 1024 for key in ("Rss", "Pss"))
+        print(f"API process {process_pid}: RSS {rss} MB, PSS {pss} MB")
+
+
+def stub_command_args(args):
+    return [
+        "--sagemaker-latency", str(args.sagemaker_latency),
+        "--openalex-latency", str(args.openalex_latency),
+        "--openai-latency", str(args.openai_latency),
+        "--embedding-latency", str(args.embedding_latency),
+        "--jitter", str(args.jitter),
+        "--tags-per-document", str(args.tags_per_document),
+        "--vocabulary-size", str(args.vocabulary_size),
+        "--config-columns", str(args.config_columns),
+    ]
+
+
+@contextlib.contextmanager
+def running_stack(args, route_groups):
+    """Start the stubs and the API; yields (api_url, stub_url)."""
+    processes = []
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            stub_port = free_port()
+            stub_url = f"http://127.0.0.1:{stub_port}"
+            processes.append(
+                subprocess.Popen(
+                    [sys.executable, "-m", "bench.stubs", "--port", str(stub_port), *stub_command_args(args)],
+                    cwd=REPO_DIR,
+                    stdout=subprocess.DEVNULL,
+                )
+            )
+            wait_until_up(f"{stub_url}/calls", processes[-1])
+
+            env = {
+                **os.environ,
+                **upstream_env(stub_url),
+                "PREDICTION_CACHE_PATH": os.path.join(tmp, "predictions.sqlite3"),
+                "NAME_CACHE_PATH": os.path.join(tmp, "names.sqlite3"),
+                "OQL_CONFIG_CACHE_PATH": os.path.join(tmp, "oql-config.sqlite3"),
+                "TIMING_LOG": "0",
+                # Only warm up (and wait on) what the measured routes use.
+                "ROUTE_GROUPS": ",".join(sorted(route_groups)),
+            }
+            env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+            api_port = free_port()
+            if args.workers:
+                command = [
+                    "gunicorn", "-w", str(args.workers),
+                    "-b", f"127.0.0.1:{api_port}", "bench.app_server:app",
+                ]
+            else:
+                command = [sys.executable, "-m", "bench.app_server", "--port", str(api_port)]
+            processes.append(
+                subprocess.Popen(command, cwd=REPO_DIR, env=env, stderr=subprocess.DEVNULL)
+            )
+            api_url = f"http://127.0.0.1:{api_port}"
+            start = time.monotonic()
+            wait_until_up(f"{api_url}/ready", processes[-1], timeout=300)
+            print(f"API ready in {time.monotonic() - start:.2f}s")
+            yield api_url, stub_url
+            print_memory(processes[-1].pid)
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                process.wait()
+
+
+def print_report(results, baseline=None):
+    header = f"{'route':<16}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    print(header)
+    print("-" * len(header))
+    for route, summary in results.items():
+        print(
+            f"{route:<16}{summary['throughput_rps']:>9}{summary['p50_ms']:>10}"
+            f"{summary['p95_ms']:>10}{summary['p99_ms']:>10}{summary['errors']:>8}"
+        )
+        if baseline and route in baseline:
+            before = baseline[route]
+            changes = []
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+                if before.get(key):
+                    changes.append(f"{key} {(summary[key] - before[key]) / before[key]:+.1%}")
+            print(f"{'':<16}vs baseline: {', '.join(changes)}")
+        if "upstream_calls_per_request" not in summary:
+            print(f"{'':<16}upstream calls/request: not measured")
+            continue
+        calls = ", ".join(
+            f"{name}={calls}" for name, calls in summary["upstream_calls_per_request"].items()
+        )
+        print(f"{'':<16}upstream calls/request: {calls or 'none'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API against local stubs.")
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma-separated, from: " + ", ".join(ROUTES))
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per route")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--distinct-documents", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=0, help="gunicorn workers (0: single threaded dev server process)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    routes = args.routes.split(",")
+    unknown = [route for route in routes if route not in ROUTES]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["routes"]
+
+    results = {}
+    route_groups = {route_group(route) for route in routes}
+    with running_stack(args, route_groups) as (api_url, stub_url):
+        for route in routes:
+            # Each route gets its own inputs so it starts with a cold cache.
+            documents = make_documents(args.distinct_documents, f"{args.seed}:{route}")
+            prompts = make_prompts(args.distinct_documents, f"{args.seed}:{route}")
+            results[route] = run_route(
+                api_url, stub_url, route, args.requests, args.concurrency,
+                documents, prompts, args.warmup,
+            )
+
+    print_report(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "routes": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
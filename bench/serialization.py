@@ -0,0 +1,179 @@
+"""
+Compare response serialization through marshmallow + json (the previous
+path) with the compiled projections + orjson in serialize.py, on 1- and
+1000-document responses of every tagger. Also checks the two produce
+byte-identical JSON. Then compares the size and encoding time of the
+related-works/authors formats, raw and compressed.
+
+    python -m bench.serialization --tags-per-document 10 --related-rows 5000
+"""
+import argparse
+import json
+import random
+import timeit
+
+from flask import Flask
+
+from batch import (
+    ConceptsBatchMessageSchema,
+    CombinedBatchMessageSchema,
+    KeywordsBatchMessageSchema,
+    TopicsBatchMessageSchema,
+    build_batch_result,
+)
+from bench.stubs import StubConfig, make_entity, scored_ids
+from combined import CombinedMessageSchema, build_combined_result
+from compress import ENCODERS
+from concepts import ConceptsMessageSchema, build_concepts_result, format_concepts
+from keywords import KeywordsMessageSchema, build_keywords_result, format_keywords
+import serialize
+from topics import TopicsMessageSchema, build_topics_result, format_topics
+from utils import index_by_id
+
+
+def formatted_predictions(config, i):
+    """The formatted keywords, topics and concepts of a synthetic document."""
+    concepts = scored_ids(config, "concepts", i)
+    keywords = [
+        {"keyword_id": f"keyword-{tag_id}", "score": score}
+        for tag_id, score in scored_ids(config, "keywords", i)
+    ]
+    topics = [
+        {"topic_id": tag_id, "topic_score": score}
+        for tag_id, score in scored_ids(config, "topics", i)
+    ]
+    return (
+        format_keywords(
+            keywords,
+            index_by_id(make_entity("keywords", f"keywords/{k['keyword_id']}") for k in keywords),
+        ),
+        format_topics(
+            topics,
+            index_by_id(make_entity("topics", f"T{t['topic_id']}") for t in topics),
+        ),
+        format_concepts(
+            concepts,
+            index_by_id(make_entity("concepts", f"C{tag_id}") for tag_id, _ in concepts),
+        ),
+    )
+
+
+def build_results(config, count):
+    """(name, result, schema_class) for each tagger's response."""
+    documents = [formatted_predictions(config, i) for i in range(count)]
+    taggers = {
+        "combined": (
+            [build_combined_result(*document) for document in documents],
+            CombinedMessageSchema,
+            CombinedBatchMessageSchema,
+        ),
+        "concepts": (
+            [build_concepts_result(document[2]) for document in documents],
+            ConceptsMessageSchema,
+            ConceptsBatchMessageSchema,
+        ),
+        "keywords": (
+            [build_keywords_result(document[0]) for document in documents],
+            KeywordsMessageSchema,
+            KeywordsBatchMessageSchema,
+        ),
+        "topics": (
+            [build_topics_result(document[1]) for document in documents],
+            TopicsMessageSchema,
+            TopicsBatchMessageSchema,
+        ),
+    }
+    for name, (results, schema_class, batch_schema_class) in taggers.items():
+        if count == 1:
+            yield name, results[0], schema_class
+        else:
+            yield f"batch/{name}", build_batch_result(results), batch_schema_class
+
+
+def marshmallow_dumps(result, schema_class):
+    # What the routes did before: a schema per request, then Flask's
+    # compact json encoding.
+    return json.dumps(
+        schema_class().dump(result), separators=(",", ":")
+    ).encode()
+
+
+def best_time(fn, number, repeat):
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def related_rows(count):
+    rng = random.Random(0)
+    return [
+        {"author_id": rng.randint(5000000000, 5999999999), "score": round(rng.random(), 6)}
+        for _ in range(count)
+    ]
+
+
+def print_related_formats(count, repeat):
+    rows = related_rows(count)
+    app = Flask(__name__)
+    app.json.sort_keys = False
+
+    def encoder(response_format):
+        return lambda: serialize.rows_response(rows, "author_id", response_format).get_data()
+
+    formats = {
+        # What the route did before: return the list and let Flask encode it.
+        "json (before)": lambda: app.json.dumps(rows, separators=(",", ":")).encode(),
+        "json": encoder("json"),
+        "columnar": encoder("columnar"),
+        "msgpack": encoder("msgpack"),
+    }
+    print()
+    print(f"{count} related rows")
+    print(f"{'format':<16}{'encode ms':>10}{'bytes':>10}{'gzip':>10}{'br':>10}{'+gzip ms':>10}{'+br ms':>10}")
+    with app.app_context():
+        for name, encode in formats.items():
+            data = encode()
+            encode_time = best_time(encode, 20, repeat)
+            sizes = {}
+            times = {}
+            for encoding, compress in ENCODERS.items():
+                sizes[encoding] = len(compress(data))
+                times[encoding] = encode_time + best_time(lambda: compress(data), 20, repeat)
+            br_time = f"{times['br'] * 1000:.2f}" if "br" in times else "-"
+            print(
+                f"{name:<16}{encode_time * 1000:>10.2f}{len(data):>10}"
+                f"{sizes['gzip']:>10}{sizes.get('br', '-'):>10}"
+                f"{times['gzip'] * 1000:>10.2f}{br_time:>10}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark response serialization.")
+    parser.add_argument("--tags-per-document", type=int, default=10)
+    parser.add_argument("--related-rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    config = StubConfig(tags_per_document=args.tags_per_document)
+
+    print(f"{'response':<18}{'docs':>6}{'marshmallow ms':>16}{'compiled ms':>13}{'speedup':>9}")
+    for count, number in ((1, 2000), (1000, 3)):
+        for name, result, schema_class in build_results(config, count):
+            slow = marshmallow_dumps(result, schema_class)
+            fast = serialize.dumps(result, schema_class)
+            if fast != slow:
+                raise AssertionError(f"{name}: compiled output differs from marshmallow")
+
+            slow_time = best_time(
+                lambda: marshmallow_dumps(result, schema_class), number, args.repeat
+            )
+            fast_time = best_time(
+                lambda: serialize.dumps(result, schema_class), number, args.repeat
+            )
+            print(
+                f"{name:<18}{count:>6}{slow_time * 1000:>16.3f}"
+                f"{fast_time * 1000:>13.3f}{slow_time / fast_time:>8.1f}x"
+            )
+
+    print_related_formats(args.related_rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
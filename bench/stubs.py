@@ -0,0 +1,451 @@
+"""
+Local stand-ins for every upstream the API calls, so it can be benchmarked
+offline: the three SageMaker models, the OpenAlex API (entity lookups,
+cursor paging, name search and /entities/config) and OpenAI chat,
+structured-output and embeddings endpoints. Predictions are derived from a
+hash of the input, so identical documents always get identical tags.
+
+    python -m bench.stubs --port 8900 --sagemaker-latency 80
+
+Each upstream lives under its own path prefix; `upstream_env(base_url)`
+returns the environment that points the app at them.
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+SEARCH_ENTITY_PREFIXES = {
+    "institutions": "I",
+    "authors": "A",
+    "keywords": "keywords/",
+    "sources": "S",
+    "funders": "F",
+    "publishers": "P",
+    "topics": "T",
+}
+
+
+class StubConfig:
+    def __init__(
+        self,
+        sagemaker_latency=0.05,
+        openalex_latency=0.03,
+        openai_latency=0.5,
+        embedding_latency=0.1,
+        jitter=0.2,
+        tags_per_document=10,
+        vocabulary_size=5000,
+        embedding_dimensions=256,
+        config_columns=40,
+    ):
+        self.sagemaker_latency = sagemaker_latency
+        self.openalex_latency = openalex_latency
+        self.openai_latency = openai_latency
+        self.embedding_latency = embedding_latency
+        self.jitter = jitter
+        self.tags_per_document = tags_per_document
+        self.vocabulary_size = vocabulary_size
+        self.embedding_dimensions = embedding_dimensions
+        self.config_columns = config_columns
+
+
+class CallCounter:
+    def __init__(self):
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+
+def upstream_env(base_url):
+    return {
+        "CONCEPTS_API_URL": f"{base_url}/sagemaker/concepts/",
+        "KEYWORDS_API_URL": f"{base_url}/sagemaker/keywords/",
+        "TOPICS_API_URL": f"{base_url}/sagemaker/topics/",
+        "OPENALEX_API_URL": f"{base_url}/openalex",
+        "OPENAI_BASE_URL": f"{base_url}/openai/v1",
+        "OPENAI_API_KEY": "stub",
+        "SAGEMAKER_API_KEY": "stub",
+    }
+
+
+def seeded_random(*parts):
+    seed = hashlib.blake2b(json.dumps(parts).encode(), digest_size=8).digest()
+    return random.Random(int.from_bytes(seed, "little"))
+
+
+def scored_ids(config, *seed):
+    rng = seeded_random(*seed)
+    ids = rng.sample(range(1, config.vocabulary_size + 1), config.tags_per_document)
+    return [(tag_id, round(rng.random(), 4)) for tag_id in ids]
+
+
+def predict_concepts(config, document):
+    tags = scored_ids(config, "concepts", document.get("title"), document.get("abstract"))
+    return {"tag_ids": [tag_id for tag_id, _ in tags], "scores": [s for _, s in tags]}
+
+
+def predict_keywords(config, document):
+    tags = scored_ids(
+        config, "keywords", document.get("title"), document.get("abstract_inverted_index")
+    )
+    return [{"keyword_id": f"keyword-{tag_id}", "score": s} for tag_id, s in tags]
+
+
+def predict_topics(config, document):
+    # The topics client sends the abstract, text or inverted, under this key.
+    tags = scored_ids(
+        config, "topics", document.get("title"), document.get("abstract_inverted_index")
+    )
+    return [{"topic_id": tag_id, "topic_score": s} for tag_id, s in tags]
+
+
+SAGEMAKER_MODELS = {
+    "concepts": predict_concepts,
+    "keywords": predict_keywords,
+    "topics": predict_topics,
+}
+
+
+def make_entity(entity_type, short_id):
+    entity = {
+        "id": f"https://openalex.org/{short_id}",
+        "display_name": f"{entity_type} {short_id}",
+    }
+    if entity_type == "topics":
+        for level, prefix in (("subfield", "subfields"), ("field", "fields"), ("domain", "domains")):
+            entity[level] = {
+                "id": f"https://openalex.org/{prefix}/{len(short_id)}",
+                "display_name": f"{level} {len(short_id)}",
+            }
+    elif entity_type == "concepts":
+        entity["level"] = 2
+        entity["ancestors"] = [
+            {"id": "https://openalex.org/C1", "display_name": "concepts C1", "level": 0},
+            {"id": "https://openalex.org/C2", "display_name": "concepts C2", "level": 1},
+        ]
+    return entity
+
+
+def entities_page(config, entity_type, params):
+    if "filter" in params:
+        ids = params["filter"].split(":", 1)[1].split("|")
+        results = [make_entity(entity_type, entity_id) for entity_id in ids]
+        return {"meta": {"count": len(results)}, "results": results}
+
+    if "search" in params:
+        prefix = SEARCH_ENTITY_PREFIXES.get(entity_type, "X")
+        entity_id = seeded_random(entity_type, params["search"]).randint(1, 10**8)
+        result = make_entity(entity_type, f"{prefix}{entity_id}")
+        return {"meta": {"count": 1}, "results": [result]}
+
+    # Cursor paging over the whole vocabulary.
+    per_page = int(params.get("per-page", 25))
+    start = 0 if params.get("cursor", "*") == "*" else int(params["cursor"])
+    end = min(start + per_page, config.vocabulary_size)
+    prefix = {"topics": "T", "concepts": "C", "keywords": "keywords/keyword-"}[entity_type]
+    results = [make_entity(entity_type, f"{prefix}{i}") for i in range(start + 1, end + 1)]
+    next_cursor = str(end) if end < config.vocabulary_size else None
+    return {
+        "meta": {"count": config.vocabulary_size, "next_cursor": next_cursor},
+        "results": results,
+    }
+
+
+def entities_config(config):
+    def columns(entity):
+        return {
+            f"{entity}-column-{i}": {
+                "id": f"{entity}.column_{i}",
+                "descr": f"Column {i} of {entity}",
+                "actions": ["filter", "sort"] if i % 3 == 0 else ["filter"],
+            }
+            for i in range(config.config_columns)
+        }
+
+    entities = {
+        entity: {"descrFull": f"All {entity}", "columns": columns(entity)}
+        for entity in ["works", *SEARCH_ENTITY_PREFIXES]
+    }
+    for entity in ["countries", "languages", "types"]:
+        entities[entity] = {
+            "descrFull": f"All {entity}",
+            "columns": columns(entity),
+            "values": [
+                {"id": f"{entity}/{i}", "display_name": f"{entity} {i}"}
+                for i in range(20)
+            ],
+        }
+    return entities
+
+
+STRUCTURED_OUTPUTS = {
+    "ParsedPromptObject": {
+        "get_rows": "works",
+        "filter_works_needed": True,
+        "filter_works_final_output": "",
+        "filter_aggs_needed": False,
+        "filter_aggs_final_output": "",
+        "sort_by_needed": False,
+        "show_columns_needed": False,
+    },
+    "ReturnColumnsObject": {"show_columns": ["display_name", "publication_year"]},
+    "SortByColumnsObject": {"sort_by_column": "cited_by_count", "sort_by_order": "desc"},
+    "ReturnSortByColumnsObject": {
+        "sort_by_column": "cited_by_count",
+        "sort_by_order": "desc",
+        "show_columns": ["display_name", "publication_year"],
+    },
+    "OQLJsonObject": {
+        "get_rows": "works",
+        "filter_works": [
+            {"column_id": "publication_year", "operator": "is", "value": 2020}
+        ],
+        "filter_aggs": [],
+        "sort_by_column": "",
+        "sort_by_order": "",
+        "show_columns": [],
+    },
+}
+
+
+class PromptCache:
+    """
+    Mimics OpenAI prompt caching: the longest prefix of the request that an
+    earlier request also started with counts as cached, once it is at least
+    1024 tokens. Prefixes are compared at message boundaries, after the
+    model, tools and response format, which providers also treat as part of
+    the prefix.
+    """
+
+    MIN_TOKENS = 1024
+
+    def __init__(self):
+        self.prefixes = set()
+        self._lock = threading.Lock()
+
+    def cached_tokens(self, body):
+        header = json.dumps(
+            [body.get("model"), body.get("tools"), body.get("response_format")],
+            sort_keys=True,
+        )
+        digest = hashlib.blake2b(header.encode(), digest_size=16)
+        length = len(header)
+        prefixes = []
+        for message in body["messages"]:
+            text = json.dumps(message, sort_keys=True)
+            digest.update(text.encode())
+            length += len(text)
+            prefixes.append((digest.hexdigest(), length // 4))
+
+        cached = 0
+        with self._lock:
+            for prefix, tokens in prefixes:
+                if prefix in self.prefixes and tokens >= self.MIN_TOKENS:
+                    cached = tokens
+            self.prefixes.update(prefix for prefix, _ in prefixes)
+        return cached
+
+
+def chat_completion(body, prompt_cache):
+    message = {"role": "assistant", "content": None}
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        schema_name = response_format["json_schema"]["name"]
+        message["content"] = json.dumps(STRUCTURED_OUTPUTS[schema_name])
+    elif body.get("tools"):
+        prompt = body["messages"][-1]["content"]
+        message["tool_calls"] = [
+            {
+                "id": "call_stub",
+                "type": "function",
+                "function": {
+                    "name": "get_institution_id",
+                    "arguments": json.dumps({"institution_name": prompt[:40]}),
+                },
+            }
+        ]
+    else:
+        message["content"] = "ok"
+
+    prompt_tokens = len(json.dumps(body["messages"])) // 4
+    cached_tokens = min(prompt_cache.cached_tokens(body), prompt_tokens)
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [
+            {
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if "tool_calls" in message else "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": 50,
+            "total_tokens": prompt_tokens + 50,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        },
+    }
+
+
+def embedding(config, body):
+    rng = seeded_random("embedding", body["input"])
+    dimensions = body.get("dimensions") or config.embedding_dimensions
+    return {
+        "object": "list",
+        "model": body.get("model", "stub"),
+        "data": [
+            {
+                "object": "embedding",
+                "index": 0,
+                "embedding": [rng.uniform(-1, 1) for _ in range(dimensions)],
+            }
+        ],
+        "usage": {"prompt_tokens": 100, "total_tokens": 100},
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+    calls = CallCounter()
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; don't let Nagle's
+        # algorithm add a delayed-ACK round trip to every response.
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def sleep(self, latency):
+        if latency > 0:
+            time.sleep(latency * random.uniform(1 - self.config.jitter, 1 + self.config.jitter))
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"null")
+        # The models are called with json=json.dumps(...), i.e. a JSON string.
+        return json.loads(body) if isinstance(body, str) else body
+
+    def send_json(self, data, status=200):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")
+        if parts[:3] == ["openalex", "entities", "config"]:
+            self.calls.add("openalex-entities-config")
+            self.sleep(self.config.openalex_latency)
+            return self.send_json(entities_config(self.config))
+        if parts[0] == "openalex" and len(parts) == 2:
+            self.calls.add(f"openalex-{parts[1]}")
+            self.sleep(self.config.openalex_latency)
+            return self.send_json(entities_page(self.config, parts[1], params))
+        if parts == ["calls"]:
+            return self.send_json(self.calls.snapshot())
+        self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if parts[0] == "sagemaker" and parts[1] in SAGEMAKER_MODELS:
+            self.calls.add(f"sagemaker-{parts[1]}")
+            documents = self.read_json()
+            self.sleep(self.config.sagemaker_latency)
+            predict = SAGEMAKER_MODELS[parts[1]]
+            return self.send_json([predict(self.config, d) for d in documents])
+        if parts[:2] == ["openai", "v1"] and parts[2:] == ["chat", "completions"]:
+            self.calls.add("openai-chat")
+            body = self.read_json()
+            self.sleep(self.config.openai_latency)
+            return self.send_json(chat_completion(body, self.prompt_cache))
+        if parts[:2] == ["openai", "v1"] and parts[2:] == ["embeddings"]:
+            self.calls.add("openai-embeddings")
+            body = self.read_json()
+            self.sleep(self.config.embedding_latency)
+            return self.send_json(embedding(self.config, body))
+        if parts == ["calls", "reset"]:
+            self.calls.reset()
+            return self.send_json({})
+        self.send_json({"error": "not found"}, 404)
+
+
+def create_stub_server(port=0, config=None):
+    handler = type("ConfiguredStubHandler", (StubHandler,), {
+        "config": config or StubConfig(),
+        "calls": CallCounter(),
+        "prompt_cache": PromptCache(),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def add_stub_arguments(parser):
+    defaults = StubConfig()
+    group = parser.add_argument_group("upstream stubs")
+    group.add_argument("--sagemaker-latency", type=float, default=defaults.sagemaker_latency, help="seconds")
+    group.add_argument("--openalex-latency", type=float, default=defaults.openalex_latency, help="seconds")
+    group.add_argument("--openai-latency", type=float, default=defaults.openai_latency, help="seconds")
+    group.add_argument("--embedding-latency", type=float, default=defaults.embedding_latency, help="seconds")
+    group.add_argument("--jitter", type=float, default=defaults.jitter, help="+/- fraction of each latency")
+    group.add_argument("--tags-per-document", type=int, default=defaults.tags_per_document)
+    group.add_argument("--vocabulary-size", type=int, default=defaults.vocabulary_size)
+    group.add_argument("--config-columns", type=int, default=defaults.config_columns)
+
+
+def stub_config_from_args(args):
+    return StubConfig(
+        sagemaker_latency=args.sagemaker_latency,
+        openalex_latency=args.openalex_latency,
+        openai_latency=args.openai_latency,
+        embedding_latency=args.embedding_latency,
+        jitter=args.jitter,
+        tags_per_document=args.tags_per_document,
+        vocabulary_size=args.vocabulary_size,
+        config_columns=args.config_columns,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the upstream stubs.")
+    parser.add_argument("--port", type=int, default=8900)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server = create_stub_server(args.port, stub_config_from_args(args))
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    print(f"Stubs listening on {base_url}")
+    for name, value in upstream_env(base_url).items():
+        print(f"export {name}={value}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,121 @@
+from collections import OrderedDict
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 from marshmallow import Schema, fields
 
-from concepts import ConceptsSchema
-from keywords import KeywordsSchema
-from topics import TopicsSchema
+from concepts import (
+    ConceptsSchema,
+    format_concepts,
+    get_concept_predictions_batch,
+    get_concepts_from_api,
+)
+from keywords import (
+    KeywordsSchema,
+    format_keywords,
+    get_keywords_from_api,
+    get_keywords_predictions_batch,
+)
+from timing import span, submit
+from topics import (
+    TopicsSchema,
+    format_topics,
+    get_topic_predictions_batch,
+    get_topics_from_api,
+)
+
+executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TAGGING_THREADS", 8)),
+    thread_name_prefix="tagging",
+)
+
+
+def get_combined_predictions(title, abstract):
+    return get_combined_predictions_batch([(title, abstract)])[0]
+
+
+def get_combined_predictions_batch(documents):
+    """
+    Run the three taggers as a dependency graph instead of one after another.
+    Concepts and topics start together, keywords start as soon as the topic
+    predictions they depend on are ready, and every branch hydrates and
+    formats its own results without waiting on the others.
+    """
+    concepts_future = submit(executor, tag_concepts_batch, documents)
+    topics_future = submit(executor, tag_topics_and_start_keywords, documents)
+
+    formatted_topics, keywords_future = topics_future.result()
+    formatted_keywords = keywords_future.result()
+    formatted_concepts = concepts_future.result()
+    return list(zip(formatted_keywords, formatted_topics, formatted_concepts))
+
+
+def tag_concepts_batch(documents):
+    concept_predictions = get_concept_predictions_batch(documents)
+    concept_ids = [
+        f"C{concept_id}"
+        for predictions in concept_predictions
+        for concept_id, _ in predictions
+    ]
+    concepts_from_api = get_concepts_from_api(concept_ids)
+    with span("concepts-formatting"):
+        return [
+            format_concepts(predictions, concepts_from_api)
+            for predictions in concept_predictions
+        ]
+
+
+def tag_keywords_batch(documents, topic_predictions=None):
+    if topic_predictions is None:
+        topic_predictions = get_topic_predictions_batch(documents)
+    keyword_predictions = get_keywords_predictions_batch(documents, topic_predictions)
+    keyword_ids = [
+        f"keywords/{keyword['keyword_id']}"
+        for predictions in keyword_predictions
+        for keyword in predictions
+    ]
+    keywords_from_api = get_keywords_from_api(keyword_ids)
+    with span("keywords-formatting"):
+        return [
+            format_keywords(predictions, keywords_from_api)
+            for predictions in keyword_predictions
+        ]
+
+
+def tag_topics_batch(documents, topic_predictions=None):
+    if topic_predictions is None:
+        topic_predictions = get_topic_predictions_batch(documents)
+    topic_ids = [
+        f"T{topic['topic_id']}"
+        for predictions in topic_predictions
+        for topic in predictions
+    ]
+    topics_from_api = get_topics_from_api(topic_ids)
+    with span("topics-formatting"):
+        return [
+            format_topics(predictions, topics_from_api)
+            for predictions in topic_predictions
+        ]
+
+
+def tag_topics_and_start_keywords(documents):
+    topic_predictions = get_topic_predictions_batch(documents)
+    keywords_future = submit(executor, tag_keywords_batch, documents, topic_predictions)
+    return tag_topics_batch(documents, topic_predictions), keywords_future
+
+
+def build_combined_result(formatted_keywords, formatted_topics, formatted_concepts):
+    result = OrderedDict()
+    result["meta"] = {
+        "keywords_count": len(formatted_keywords),
+        "topics_count": len(formatted_topics),
+        "concepts_count": len(formatted_concepts),
+    }
+    result["keywords"] = formatted_keywords
+    result["primary_topic"] = formatted_topics[0] if formatted_topics else None
+    result["topics"] = formatted_topics
+    result["concepts"] = formatted_concepts
+    return result
 
 
 class MetaSchema(Schema):
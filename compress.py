@@ -0,0 +1,56 @@
+"""
+Response compression negotiated from Accept-Encoding: brotli when the
+client takes it and the brotli package is installed, gzip otherwise.
+Streamed responses are left alone so their lines still go out as they
+are produced.
+"""
+import gzip
+import os
+
+from flask import request
+
+from timing import span
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+COMPRESSIBLE_MIMETYPES = {"application/json", "application/msgpack"}
+
+# Fast levels: these are compressed per request, not once ahead of time.
+ENCODERS = {"gzip": lambda data: gzip.compress(data, compresslevel=5)}
+if brotli is not None:
+    ENCODERS = {"br": lambda data: brotli.compress(data, quality=4), **ENCODERS}
+
+
+def compress_response(response):
+    if (
+        response.status_code != 200
+        or response.is_streamed
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(list(ENCODERS))
+    data = response.get_data()
+    if encoding is None or len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    with span("compression"):
+        response.set_data(ENCODERS[encoding](data))
+    response.headers["Content-Encoding"] = encoding
+    # The compressed bytes differ from the identity ones, so like nginx the
+    # ETag is downgraded to weak; If-None-Match uses weak comparison anyway.
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
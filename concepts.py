@@ -1,59 +1,87 @@
+from collections import OrderedDict
 import json
 import os
 
 from marshmallow import Schema, fields
-import requests
 
-from utils import format_score
+from entities import ENTITY_CACHES
+from prediction_cache import get_cached_predictions
+from predictors import make_predictor
+from timing import span
+from utils import index_by_id, join_scores
+
+
+CONCEPTS_API_URL = os.getenv(
+    "CONCEPTS_API_URL", "https://l7a8sw8o2a.execute-api.us-east-1.amazonaws.com/api/"
+)
+CONCEPTS_MODEL_VERSION = os.getenv("CONCEPTS_MODEL_VERSION", "1")
 
 
 def get_concept_predictions(title, abstract):
-    api_url = "https://l7a8sw8o2a.execute-api.us-east-1.amazonaws.com/api/"
-    api_key = os.getenv("SAGEMAKER_API_KEY")
-    headers = {"X-API-Key": api_key}
-    data_list = [
-        {
-            "title": title,
-            "doc_type": "",
-            "journal": "",
-            "abstract": abstract,
-            "inverted_abstract": False,
-            "paper_id": 1234,
-        }
-    ]
-
-    r = requests.post(api_url, json=json.dumps(data_list), headers=headers)
-    if r.status_code == 200:
-        response_json = r.json()
-        resp_data = response_json[0]
-        concepts_combined = list(zip(resp_data["tag_ids"], resp_data["scores"]))
-        concepts_ordered = sorted(concepts_combined, key=lambda x: x[1], reverse=True)
-        concepts_without_0 = [x for x in concepts_ordered if x[1] > 0]
-        return concepts_without_0
-    else:
-        print(f"Error tagging concepts: {r.status_code}")
-        return []
+    return get_concept_predictions_batch([(title, abstract)])[0]
 
 
-def get_concepts_from_api(concept_ids):
-    r = requests.get(
-        "https://api.openalex.org/concepts?filter=ids.openalex:{0}".format(
-            "|".join(concept_ids)
-        )
+def get_concept_predictions_batch(documents):
+    return get_cached_predictions(
+        CONCEPTS_PREDICTOR.model_id, documents, CONCEPTS_PREDICTOR.predict
+    )
+
+
+def encode_concepts_request(documents):
+    return json.dumps(
+        [
+            {
+                "title": title,
+                "doc_type": "",
+                "journal": "",
+                "abstract": abstract,
+                "inverted_abstract": isinstance(abstract, dict),
+                "paper_id": paper_id,
+            }
+            for paper_id, (title, abstract) in enumerate(documents)
+        ]
     )
-    concepts_from_api = r.json()["results"]
-    return concepts_from_api
+
+
+def parse_concept_prediction(resp_data):
+    concepts_combined = list(zip(resp_data["tag_ids"], resp_data["scores"]))
+    concepts_ordered = sorted(concepts_combined, key=lambda x: x[1], reverse=True)
+    concepts_without_0 = [x for x in concepts_ordered if x[1] > 0]
+    return concepts_without_0
+
+
+CONCEPTS_PREDICTOR = make_predictor(
+    "concepts",
+    CONCEPTS_API_URL,
+    CONCEPTS_MODEL_VERSION,
+    encode_concepts_request,
+    parse_concept_prediction,
+    lambda concept_id, score: (concept_id, score),
+)
+
+
+def get_concepts_from_api(concept_ids):
+    with span("concepts-hydration"):
+        return index_by_id(ENTITY_CACHES["concepts"].get_many(concept_ids))
 
 
 def format_concepts(concept_predictions, concepts_from_api):
-    ordered_concepts = []
-    for concept_id, concept_score in concept_predictions:
-        for api_concept in concepts_from_api:
-            if api_concept["id"] == f"https://openalex.org/C{concept_id}":
-                api_concept["score"] = format_score(concept_score)
-                ordered_concepts.append(api_concept)
-                break
-    return ordered_concepts
+    return join_scores(
+        (
+            (f"https://openalex.org/C{concept_id}", concept_score)
+            for concept_id, concept_score in concept_predictions
+        ),
+        concepts_from_api,
+    )
+
+
+def build_concepts_result(formatted_concepts):
+    result = OrderedDict()
+    result["meta"] = {
+        "count": len(formatted_concepts),
+    }
+    result["concepts"] = formatted_concepts
+    return result
 
 
 class AncestorsSchema(Schema):
@@ -0,0 +1,106 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from metrics import record_cache_lookups
+
+
+class DiskCache:
+    """
+    Small key/value cache in a local SQLite file, shared by every gunicorn
+    worker on the host. Values are stored as JSON, entries expire after a
+    TTL and the table is pruned back to max_entries (oldest first).
+    """
+
+    def __init__(self, path, table, max_entries, ttl):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        # sqlite connections can't be shared across threads or a fork.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_expires_at "
+                f"ON {self.table} (expires_at)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        return {key: value for key, (value, _) in self.get_many_with_expiry(keys).items()}
+
+    def get_many_with_expiry(self, keys):
+        """{key: (value, expires_at)}, expires_at being time.time() based."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        if keys:
+            try:
+                rows = self._connection().execute(
+                    f"SELECT key, value, expires_at FROM {self.table} "
+                    f"WHERE key IN ({','.join('?' * len(keys))}) AND expires_at > ?",
+                    (*keys, time.time()),
+                ).fetchall()
+            except sqlite3.Error as e:
+                print(f"Error reading {self.table} cache: {e}")
+                rows = []
+            found = {key: (json.loads(value), expires_at) for key, value, expires_at in rows}
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        record_cache_lookups(self.table, len(found), len(keys) - len(found))
+        return found
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items, ttl=None):
+        if not items:
+            return
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        try:
+            conn = self._connection()
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) "
+                "VALUES (?, ?, ?)",
+                [(key, json.dumps(value), expires_at) for key, value in items.items()],
+            )
+            if random.random() < 0.01:
+                self.prune(conn)
+        except sqlite3.Error as e:
+            print(f"Error writing {self.table} cache: {e}")
+
+    def prune(self, conn=None):
+        conn = conn or self._connection()
+        conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+        (count,) = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY expires_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,268 @@
+from collections import OrderedDict
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from metrics import record_cache_lookups
+import upstream
+from utils import chunks
+
+OPENALEX_API_URL = upstream.OPENALEX_API_URL
+OPENALEX_ID_PREFIX = "https://openalex.org/"
+# The OpenAlex API accepts at most 100 values in a single OR filter.
+MAX_IDS_PER_REQUEST = 100
+MAX_PER_PAGE = 200
+ENTITY_CACHE_TTL = int(os.getenv("ENTITY_CACHE_TTL", 24 * 60 * 60))
+# IDs the API doesn't return (merged or deleted entities) are remembered as
+# missing for this long, so they aren't looked up again on every request.
+ENTITY_CACHE_NEGATIVE_TTL = int(os.getenv("ENTITY_CACHE_NEGATIVE_TTL", 60 * 60))
+# Per entity type; enough for a full preload of the largest type (concepts).
+ENTITY_CACHE_MAX_ENTRIES = int(os.getenv("ENTITY_CACHE_MAX_ENTRIES", 100_000))
+
+# Only the fields the response schemas use are requested and cached.
+ENTITY_FIELDS = {
+    "topics": ["id", "display_name", "subfield", "field", "domain"],
+    "concepts": ["id", "display_name", "level", "ancestors"],
+    "keywords": ["id", "display_name"],
+}
+
+
+def get_entities_from_api(entity_type, filter_name, entity_ids):
+    """
+    Look up a list of entity IDs (e.g. "T10001", "C41008148", "keywords/x")
+    with as few OpenAlex API calls as possible. IDs are deduplicated and
+    only split into several calls when there are more than the API allows
+    in one filter.
+    """
+    unique_ids = list(dict.fromkeys(entity_ids))
+    entities_from_api = []
+    for ids_chunk in chunks(unique_ids, MAX_IDS_PER_REQUEST):
+        r = upstream.get(
+            f"{OPENALEX_API_URL}/{entity_type}",
+            params={
+                "filter": f"{filter_name}:{'|'.join(ids_chunk)}",
+                "select": ",".join(ENTITY_FIELDS[entity_type]),
+                "per-page": MAX_IDS_PER_REQUEST,
+            },
+        )
+        entities_from_api.extend(r.json()["results"])
+    return entities_from_api
+
+
+def iter_all_entities(entity_type):
+    """Page through every entity of a type with cursor paging."""
+    cursor = "*"
+    while cursor:
+        r = upstream.get(
+            f"{OPENALEX_API_URL}/{entity_type}",
+            params={
+                "select": ",".join(ENTITY_FIELDS[entity_type]),
+                "per-page": MAX_PER_PAGE,
+                "cursor": cursor,
+            },
+        )
+        response_json = r.json()
+        yield from response_json["results"]
+        cursor = response_json["meta"].get("next_cursor")
+
+
+def short_id(entity):
+    return entity["id"].removeprefix(OPENALEX_ID_PREFIX)
+
+
+class EntityCache:
+    """
+    In-process metadata cache keyed by short OpenAlex ID ("T10001",
+    "keywords/x"). Missing and expired IDs are fetched together in one
+    batched API call; cached records are shared and must not be mutated.
+    It holds at most max_entries, dropping the least recently used.
+    """
+
+    def __init__(
+        self,
+        entity_type,
+        filter_name,
+        ttl=ENTITY_CACHE_TTL,
+        negative_ttl=ENTITY_CACHE_NEGATIVE_TTL,
+        max_entries=ENTITY_CACHE_MAX_ENTRIES,
+    ):
+        self.entity_type = entity_type
+        self.filter_name = filter_name
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, entity_ids):
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self._lock:
+            for entity_id in dict.fromkeys(entity_ids):
+                entry = self._entries.get(entity_id)
+                if entry and entry[0] > now:
+                    # None for an ID cached as missing.
+                    found[entity_id] = entry[1]
+                    self._entries.move_to_end(entity_id)
+                else:
+                    missing.append(entity_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+        record_cache_lookups(f"entities-{self.entity_type}", len(found), len(missing))
+
+        if missing:
+            entities = get_entities_from_api(
+                self.entity_type, self.filter_name, missing
+            )
+            self.set_many(entities)
+            found.update((short_id(entity), entity) for entity in entities)
+            self.set_missing(entity_id for entity_id in missing if entity_id not in found)
+        return [entity for entity in found.values() if entity is not None]
+
+    def set_many(self, entities):
+        expires_at = time.monotonic() + self.ttl
+        # Built before taking the lock: preload passes a generator that pages
+        # through the API.
+        self._store([(short_id(entity), (expires_at, entity)) for entity in entities])
+
+    def set_missing(self, entity_ids):
+        expires_at = time.monotonic() + self.negative_ttl
+        self._store([(entity_id, (expires_at, None)) for entity_id in entity_ids])
+
+    def _store(self, entries):
+        with self._lock:
+            for entity_id, entry in entries:
+                self._entries[entity_id] = entry
+                self._entries.move_to_end(entity_id)
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+    def preload(self):
+        self.set_many(iter_all_entities(self.entity_type))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+# Snapshot layout (built by entity_snapshot.py):
+#   header   b"OAXSNAP1", uint32 record count, uint32 reserved
+#   index    one (uint64 id hash, uint64 offset, uint32 length) per record,
+#            sorted by hash
+#   records  one JSON object per entity
+MAGIC = b"OAXSNAP1"
+HEADER = struct.Struct("<8sII")
+INDEX_ENTRY = struct.Struct("<QQI")
+
+
+def hash_id(entity_id):
+    return int.from_bytes(
+        hashlib.blake2b(entity_id.encode(), digest_size=8).digest(), "little"
+    )
+
+
+class EntitySnapshot:
+    """
+    Memory-mapped, read-only entity metadata. Every gunicorn worker maps the
+    same file, so the records live once in the page cache instead of once
+    per worker.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, _ = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an entity snapshot")
+
+    def get(self, entity_id):
+        key_hash = hash_id(entity_id)
+        i = self._find_first(key_hash)
+        while i < self.count:
+            entry_hash, offset, length = self._entry(i)
+            if entry_hash != key_hash:
+                break
+            entity = json.loads(self._mmap[offset:offset + length])
+            if short_id(entity) == entity_id:
+                return entity
+            i += 1
+        return None
+
+    def _entry(self, i):
+        return INDEX_ENTRY.unpack_from(self._mmap, HEADER.size + i * INDEX_ENTRY.size)
+
+    def _find_first(self, key_hash):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] < key_hash:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+class SnapshotEntityStore:
+    """Serves one entity type out of a snapshot; same interface as EntityCache."""
+
+    def __init__(self, snapshot, entity_type):
+        self.snapshot = snapshot
+        self.entity_type = entity_type
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_many(self, entity_ids):
+        entities = []
+        for entity_id in dict.fromkeys(entity_ids):
+            entity = self.snapshot.get(entity_id)
+            if entity is not None:
+                entities.append(entity)
+        misses = len(set(entity_ids)) - len(entities)
+        with self._lock:
+            self.hits += len(entities)
+            self.misses += misses
+        record_cache_lookups(f"entities-{self.entity_type}", len(entities), misses)
+        return entities
+
+    def preload(self):
+        pass
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": self.snapshot.count}
+
+
+def create_entity_stores():
+    snapshot_path = os.getenv("ENTITY_SNAPSHOT_PATH")
+    if snapshot_path:
+        # Serve hydration from a local snapshot and never call the API.
+        snapshot = EntitySnapshot(snapshot_path)
+        return {
+            entity_type: SnapshotEntityStore(snapshot, entity_type)
+            for entity_type in ENTITY_FIELDS
+        }
+
+    return {
+        "topics": EntityCache("topics", "id"),
+        "concepts": EntityCache("concepts", "ids.openalex"),
+        "keywords": EntityCache("keywords", "id"),
+    }
+
+
+ENTITY_CACHES = create_entity_stores()
+
+
+def preload_entity_caches(entity_types):
+    for entity_type in entity_types:
+        start = time.monotonic()
+        ENTITY_CACHES[entity_type].preload()
+        print(
+            f"Preloaded {ENTITY_CACHES[entity_type].stats()['size']} {entity_type} "
+            f"in {time.monotonic() - start:.1f}s"
+        )
@@ -0,0 +1,98 @@
+"""
+Build the read-only topic, concept and keyword snapshot that is served by
+entities.EntitySnapshot when ENTITY_SNAPSHOT_PATH is set:
+
+    python entity_snapshot.py build entities.snap --api
+    python entity_snapshot.py build entities.snap --dump-dir /path/to/openalex-snapshot
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+
+from entities import (
+    ENTITY_FIELDS,
+    HEADER,
+    INDEX_ENTRY,
+    MAGIC,
+    hash_id,
+    iter_all_entities,
+    short_id,
+)
+
+
+def write_snapshot(path, entities):
+    index = []
+    records = []
+    offset = 0
+    for entity in entities:
+        record = json.dumps(entity, separators=(",", ":")).encode()
+        index.append((hash_id(short_id(entity)), offset, len(record)))
+        records.append(record)
+        offset += len(record)
+
+    records_start = HEADER.size + len(index) * INDEX_ENTRY.size
+    index.sort()
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(index), 0))
+        for key_hash, record_offset, length in index:
+            f.write(INDEX_ENTRY.pack(key_hash, records_start + record_offset, length))
+        for record in records:
+            f.write(record)
+    os.replace(tmp_path, path)
+    return len(index)
+
+
+def iter_dump_entities(dump_dir, entity_type):
+    """Read an OpenAlex snapshot (data/<entity>/updated_date=*/part_*.gz)."""
+    pattern = os.path.join(dump_dir, "data", entity_type, "*", "*.gz")
+    for part in sorted(glob.glob(pattern)):
+        with gzip.open(part, "rt") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def trim_entity(entity, entity_type):
+    return {field: entity[field] for field in ENTITY_FIELDS[entity_type] if field in entity}
+
+
+def build(args):
+    entity_types = args.entity_types.split(",")
+
+    def iter_entities():
+        for entity_type in entity_types:
+            if args.dump_dir:
+                source = iter_dump_entities(args.dump_dir, entity_type)
+            else:
+                source = iter_all_entities(entity_type)
+            for entity in source:
+                yield trim_entity(entity, entity_type)
+
+    count = write_snapshot(args.output, iter_entities())
+    print(f"Wrote {count} entities to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an entity metadata snapshot.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("output")
+    source = build_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dump-dir", help="root of an OpenAlex snapshot download")
+    source.add_argument("--api", action="store_true", help="page through api.openalex.org")
+    build_parser.add_argument(
+        "--entity-types", default=",".join(ENTITY_FIELDS.keys())
+    )
+    build_parser.set_defaults(func=build)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
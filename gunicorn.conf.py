@@ -0,0 +1,23 @@
+import os
+import shutil
+import tempfile
+
+# Workers write their metrics to this directory and /metrics aggregates
+# them. It has to be set before the app (and prometheus_client) is imported
+# and emptied on every start so counters from old workers don't linger.
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR",
+    os.path.join(tempfile.gettempdir(), "openalex-text-metrics"),
+)
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+# Import the app, and so run its warm-up, once in the master; workers are
+# forked from it already warm and share that memory copy-on-write.
+preload_app = True
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
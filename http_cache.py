@@ -0,0 +1,59 @@
+"""
+HTTP caching for the deterministic GET routes. The ETag is the canonical
+input hash (the one the prediction cache uses) plus the path and every
+model and data version the response depends on, so it is known before any
+work is done and an If-None-Match hit is answered with a bare 304.
+"""
+import functools
+import os
+
+from flask import Response, make_response, request
+
+from prediction_cache import canonical_text_hash
+
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", 24 * 60 * 60))
+# Bump to invalidate every ETag, e.g. after a response format change or an
+# entity metadata refresh.
+RESPONSE_VERSION = os.getenv("RESPONSE_VERSION", "1")
+
+
+def conditional(get_input, *versions):
+    """
+    Give a GET view an ETag and Cache-Control. get_input returns the
+    (title, abstract) the response is a function of; versions are the model
+    or data versions it also depends on, or callables returning them for
+    versions only known once a lazily imported module is loaded.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+
+            title, abstract = get_input()
+            etag = canonical_text_hash(
+                title,
+                abstract,
+                request.path,
+                RESPONSE_VERSION,
+                *(version() if callable(version) else version for version in versions),
+            )
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            # Weak, and varying on Accept-Encoding, on the 304 as on the 200,
+            # since compress may have encoded the body the ETag stands for.
+            response.set_etag(etag, weak=True)
+            response.vary.add("Accept-Encoding")
+            response.cache_control.public = True
+            response.cache_control.max_age = HTTP_CACHE_MAX_AGE
+            return response
+
+        return wrapper
+
+    return decorator
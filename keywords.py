@@ -1,57 +1,85 @@
+from collections import OrderedDict
 import json
 import os
 
 from marshmallow import Schema, fields
-import requests
 
+from entities import ENTITY_CACHES
+from prediction_cache import get_cached_predictions
+from predictors import make_predictor
+from timing import span
 from topics import get_topic_predictions
-from utils import format_score
+from utils import index_by_id, join_scores
 
 
-def get_keywords_predictions(title, abstract):
-    api_url = "https://qapir74yac.execute-api.us-east-1.amazonaws.com/api/"
-    api_key = os.getenv("SAGEMAKER_API_KEY")
-    headers = {"X-API-Key": api_key}
+KEYWORDS_API_URL = os.getenv(
+    "KEYWORDS_API_URL", "https://qapir74yac.execute-api.us-east-1.amazonaws.com/api/"
+)
+KEYWORDS_MODEL_VERSION = os.getenv("KEYWORDS_MODEL_VERSION", "1")
 
-    topic_predictions = get_topic_predictions(title, abstract)
-    topic_ids = [topic["topic_id"] for topic in topic_predictions]
-    input_data = {
-        "title": title,
-        "abstract_inverted_index": abstract,
-        "inverted": False,
-        "topics": topic_ids,
-    }
 
-    r = requests.post(api_url, json=json.dumps([input_data]), headers=headers)
-    if r.status_code == 200:
-        response_json = r.json()
-        resp_data = response_json[0]
-        return resp_data
-    else:
-        print(f"Error tagging keywords: {r.status_code}")
-        return []
+def get_keywords_predictions(title, abstract, topic_predictions=None):
+    if topic_predictions is None:
+        topic_predictions = get_topic_predictions(title, abstract)
+    return get_keywords_predictions_batch([(title, abstract)], [topic_predictions])[0]
 
 
-def get_keywords_from_api(keyword_ids):
-    r = requests.get(
-        "https://api.openalex.org/keywords?filter=id:{0}".format("|".join(keyword_ids))
+def get_keywords_predictions_batch(documents, topic_predictions):
+    documents_with_topics = [
+        (title, abstract, [topic["topic_id"] for topic in document_topics])
+        for (title, abstract), document_topics in zip(documents, topic_predictions)
+    ]
+    return get_cached_predictions(
+        KEYWORDS_PREDICTOR.model_id, documents_with_topics, KEYWORDS_PREDICTOR.predict
     )
-    keywords_from_api = r.json()["results"]
-    return keywords_from_api
+
+
+def encode_keywords_request(documents):
+    return json.dumps(
+        [
+            {
+                "title": title,
+                "abstract_inverted_index": abstract,
+                "inverted": isinstance(abstract, dict),
+                "topics": topic_ids,
+            }
+            for title, abstract, topic_ids in documents
+        ]
+    )
+
+
+KEYWORDS_PREDICTOR = make_predictor(
+    "keywords",
+    KEYWORDS_API_URL,
+    KEYWORDS_MODEL_VERSION,
+    encode_keywords_request,
+    lambda resp_data: resp_data,
+    lambda keyword_id, score: {"keyword_id": keyword_id, "score": score},
+)
+
+
+def get_keywords_from_api(keyword_ids):
+    with span("keywords-hydration"):
+        return index_by_id(ENTITY_CACHES["keywords"].get_many(keyword_ids))
 
 
 def format_keywords(keyword_predictions, keywords_from_api):
-    ordered_keywords = []
-    for keyword in keyword_predictions:
-        for api_keyword in keywords_from_api:
-            if (
-                api_keyword["id"]
-                == f"https://openalex.org/keywords/{keyword['keyword_id']}"
-            ):
-                api_keyword["score"] = format_score(keyword["score"])
-                ordered_keywords.append(api_keyword)
-                break
-    return ordered_keywords
+    return join_scores(
+        (
+            (f"https://openalex.org/keywords/{keyword['keyword_id']}", keyword["score"])
+            for keyword in keyword_predictions
+        ),
+        keywords_from_api,
+    )
+
+
+def build_keywords_result(formatted_keywords):
+    result = OrderedDict()
+    result["meta"] = {
+        "count": len(formatted_keywords),
+    }
+    result["keywords"] = formatted_keywords
+    return result
 
 
 class KeywordsSchema(Schema):
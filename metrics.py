@@ -0,0 +1,149 @@
+"""
+Prometheus metrics, served from /metrics. Under gunicorn the values are
+aggregated across workers through prometheus_client's multiprocess mode
+(PROMETHEUS_MULTIPROC_DIR, set up in gunicorn.conf.py). Cache hit ratios
+are rate(text_api_cache_lookups_total{result="hit"}) over all lookups; the
+OpenAI prompt cache hit ratio is text_api_openai_cached_tokens_total over
+text_api_openai_prompt_tokens_total.
+"""
+from contextlib import contextmanager
+import os
+import re
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from timing import span
+
+REQUEST_LATENCY = Histogram(
+    "text_api_request_seconds",
+    "Latency of API requests by route.",
+    ["route", "method", "status"],
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80),
+)
+UPSTREAM_LATENCY = Histogram(
+    "text_api_upstream_seconds",
+    "Latency of calls to SageMaker, OpenAlex, OpenAI and Postgres.",
+    ["upstream"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40),
+)
+UPSTREAM_ERRORS = Counter(
+    "text_api_upstream_errors_total",
+    "Upstream calls that raised or returned a 5xx/429.",
+    ["upstream"],
+)
+UPSTREAM_RETRIES = Counter(
+    "text_api_upstream_retries_total",
+    "HTTP retries made by the pooled upstream client.",
+    ["host"],
+)
+OQL_RETRIES = Counter(
+    "text_api_oql_retries_total",
+    "Extra model attempts made by the OQL retry loops.",
+    ["stage"],
+)
+OQL_ERRORS = Counter(
+    "text_api_oql_errors_total",
+    "OQL requests that ended without a valid object.",
+    ["stage"],
+)
+OPENAI_PROMPT_TOKENS = Counter(
+    "text_api_openai_prompt_tokens_total",
+    "Prompt tokens sent to OpenAI chat models by OQL stage.",
+    ["stage"],
+)
+OPENAI_CACHED_TOKENS = Counter(
+    "text_api_openai_cached_tokens_total",
+    "Prompt tokens OpenAI served from its prompt cache, by OQL stage.",
+    ["stage"],
+)
+COALESCED_CALLS = Counter(
+    "text_api_coalesced_calls_total",
+    "Calls that joined an identical in-flight call instead of making their own.",
+    ["flight"],
+)
+CACHE_LOOKUPS = Counter(
+    "text_api_cache_lookups_total",
+    "Cache lookups by cache and result (hit or miss).",
+    ["cache", "result"],
+)
+
+
+@contextmanager
+def observe_upstream(upstream):
+    """
+    Time one call to an upstream. It is also recorded as an
+    "upstream-<name>" Server-Timing span, so a request's upstream calls can
+    be counted from its header.
+    """
+    start = time.perf_counter()
+    try:
+        with span("upstream-" + re.sub(r"[^\w.-]", "-", upstream)):
+            yield
+    except Exception:
+        UPSTREAM_ERRORS.labels(upstream).inc()
+        raise
+    finally:
+        UPSTREAM_LATENCY.labels(upstream).observe(time.perf_counter() - start)
+
+
+def record_token_usage(stage, usage):
+    """Count the prompt and cached tokens of an OpenAI completion's usage."""
+    if usage is None:
+        return
+    OPENAI_PROMPT_TOKENS.labels(stage).inc(usage.prompt_tokens)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None) or 0
+    if cached_tokens:
+        OPENAI_CACHED_TOKENS.labels(stage).inc(cached_tokens)
+
+
+def record_cache_lookups(cache, hits, misses):
+    if hits:
+        CACHE_LOOKUPS.labels(cache, "hit").inc(hits)
+    if misses:
+        CACHE_LOOKUPS.labels(cache, "miss").inc(misses)
+
+
+def start_request():
+    g.metrics_start = time.perf_counter()
+
+
+def finish_request(response):
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return response
+
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    latency = REQUEST_LATENCY.labels(route, request.method, response.status_code)
+    if response.is_streamed:
+        # The body is generated after this hook, while it is being sent, so
+        # a streamed response is timed until it has been fully sent.
+        response.call_on_close(lambda: latency.observe(time.perf_counter() - start))
+    else:
+        latency.observe(time.perf_counter() - start)
+    return response
+
+
+def metrics_view():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
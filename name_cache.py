@@ -0,0 +1,89 @@
+"""
+Cache of the OpenAlex IDs that OQL tool calls resolve names to ("Harvard"
+-> I136199984), keyed by entity type and normalized name. An in-process
+LRU sits in front of a DiskCache shared by every worker on the host.
+Names the API has no match for are cached too, for a shorter TTL, so a
+misspelling isn't searched for again on every retry.
+"""
+from collections import OrderedDict
+import os
+import tempfile
+import threading
+import time
+
+from disk_cache import DiskCache
+from metrics import record_cache_lookups
+from prediction_cache import normalize_text
+
+NAME_CACHE_PATH = os.getenv(
+    "NAME_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "openalex-text-names.sqlite3"),
+)
+NAME_CACHE_MEMORY_ENTRIES = int(os.getenv("NAME_CACHE_MEMORY_ENTRIES", 10_000))
+NAME_CACHE_MAX_ENTRIES = int(os.getenv("NAME_CACHE_MAX_ENTRIES", 200_000))
+NAME_CACHE_TTL = int(os.getenv("NAME_CACHE_TTL", 7 * 24 * 60 * 60))
+NAME_CACHE_NEGATIVE_TTL = int(os.getenv("NAME_CACHE_NEGATIVE_TTL", 60 * 60))
+
+
+class NameCache:
+    def __init__(self, memory_entries, ttl, negative_ttl, disk_cache=None):
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.disk_cache = disk_cache
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(entity_type, name):
+        return f"{entity_type}:{normalize_text(name).casefold()}"
+
+    def get(self, entity_type, name):
+        """(found, entity_id); a cached "not found" is (True, None)."""
+        key = self.key(entity_type, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+            else:
+                entry = None
+        record_cache_lookups("entity_names_memory", int(entry is not None), int(entry is None))
+        if entry:
+            return True, entry[1]
+
+        if self.disk_cache:
+            stored = self.disk_cache.get_many_with_expiry([key])
+            if key in stored:
+                entity_id, expires_at = stored[key]
+                # Kept in memory only for what is left of its disk TTL.
+                self._remember(key, entity_id, expires_at - time.time())
+                return True, entity_id
+        return False, None
+
+    def set(self, entity_type, name, entity_id):
+        """Cache a resolved ID, or None for a name the API has no match for."""
+        key = self.key(entity_type, name)
+        ttl = self.ttl if entity_id is not None else self.negative_ttl
+        self._remember(key, entity_id, ttl)
+        if self.disk_cache:
+            self.disk_cache.set(key, entity_id, ttl=ttl)
+
+    def _remember(self, key, entity_id, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, entity_id)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.memory_entries:
+                self._entries.popitem(last=False)
+
+
+# Set NAME_CACHE_PATH to an empty string to keep the cache in memory only.
+entity_names = NameCache(
+    NAME_CACHE_MEMORY_ENTRIES,
+    NAME_CACHE_TTL,
+    NAME_CACHE_NEGATIVE_TTL,
+    disk_cache=(
+        DiskCache(NAME_CACHE_PATH, "entity_names", NAME_CACHE_MAX_ENTRIES, NAME_CACHE_TTL)
+        if NAME_CACHE_PATH
+        else None
+    ),
+)
@@ -1,25 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor, wait
 import functools
 import json
 import os
 import random
 import datetime
 import requests
+import tempfile
 # import tiktoken
 from typing import Union
 from flask import jsonify
-from openai import OpenAI
 from pydantic import BaseModel, StrictStr, StrictBool, StrictFloat, StrictInt
 from marshmallow import Schema, fields
 from oqo_validate import OQOValidator
 
+from disk_cache import DiskCache
+from metrics import OQL_ERRORS, OQL_RETRIES, observe_upstream, record_token_usage
+from name_cache import entity_names
+from refreshing import RefreshingValue
+from singleflight import SingleFlight
+from timing import span, submit, timed
+import upstream
+
 openai_model_version = "gpt-4o-2024-08-06"
 
-# @functools.lru_cache(maxsize=64)
+oql_requests = SingleFlight("oql")
+
+OQL_TOOL_DEADLINE = float(os.getenv("OQL_TOOL_DEADLINE", 10))
+
 def get_openai_response(prompt):
-    api_key = os.getenv("OPENAI_API_KEY")
-    # api_key = config_vars['OPENAI_API_KEY']
-    client = OpenAI(api_key=api_key)
-    oql_entities = get_all_entities_and_columns()
+    # Identical prompts that arrive while one is being answered share its
+    # OpenAI calls. Error responses are rebuilt so each caller gets its own
+    # Response object.
+    openai_response = oql_requests.do(prompt, create_openai_response, prompt)
+    if isinstance(openai_response, tuple):
+        error_response, status = openai_response
+        return jsonify(error_response.get_json()), status
+    return openai_response
+
+# @functools.lru_cache(maxsize=64)
+def create_openai_response(prompt):
+    client = upstream.get_openai_client()
+    config = get_oql_config()
+    oql_entities = config.value
 
     
     # Quick check for entity
@@ -32,7 +54,7 @@ def get_openai_response(prompt):
     prompt_ok = check_prompt_for_safety(prompt)
 
     # Load the OQO validator
-    validator = OQOValidator()
+    validator = get_oql_validator()
     
     if not prompt_ok:
         return (jsonify(
@@ -44,24 +66,30 @@ def get_openai_response(prompt):
         )
 
     # Figuring out which parts need to be figured out by the model
-    messages_parsed = messages_for_parse_prompt(oql_entities)
-    messages_parsed.append({"role": "user", "content": prompt})
+    parse_prompt_prefix, examples_prefix = get_prompt_prefixes(config)
+    messages_parsed = [
+        *parse_prompt_prefix,
+        current_year_message(),
+        {"role": "user", "content": prompt},
+    ]
 
     # enc = tiktoken.encoding_for_model("gpt-4o")
     # print(len(enc.encode(json.dumps(messages_parsed))))
 
-    completion = client.beta.chat.completions.parse(
-            model=openai_model_version,
-            messages=messages_parsed,
-            response_format=ParsedPromptObject,
-            temperature=0.2
-        )
+    with span("oql-parse"), observe_upstream("openai-chat"):
+        completion = client.beta.chat.completions.parse(
+                model=openai_model_version,
+                messages=messages_parsed,
+                response_format=ParsedPromptObject,
+                temperature=0.2
+            )
     
+    record_token_usage("parse", completion.usage)
     parsed_prompt = json.loads(completion.choices[0].message.content)
     # print(parsed_prompt)
 
     # Getting examples to feed the model
-    messages = example_messages_for_chat(oql_entities)
+    messages = [*examples_prefix, current_year_message()]
 
     if (not parsed_prompt['filter_works_needed'] and 
         not parsed_prompt['filter_aggs_needed'] and
@@ -71,10 +99,12 @@ def get_openai_response(prompt):
             return {}
         else:
             json_object = {"get_rows": parsed_prompt['get_rows']}
-            ok, error_message = validator.validate(json_object)
+            with span("oql-validation"):
+                ok, error_message = validator.validate(json_object)
             if ok:
                 return json_object
             else:
+                OQL_ERRORS.labels("get-rows").inc()
                 return (
                     jsonify(
                         {
@@ -101,17 +131,22 @@ def get_openai_response(prompt):
         while not ok:
             if i == 2:
                 break
-            completion = client.beta.chat.completions.parse(
-                model=openai_model_version,
-                messages=messages,
-                response_format=ReturnColumnsObject,
-                temperature=0.2
-            )
-
+            if i > 0:
+                OQL_RETRIES.labels("columns").inc()
+            with span("oql-columns"), observe_upstream("openai-chat"):
+                completion = client.beta.chat.completions.parse(
+                    model=openai_model_version,
+                    messages=messages,
+                    response_format=ReturnColumnsObject,
+                    temperature=0.2
+                )
+
+            record_token_usage("columns", completion.usage)
             json_object = json.loads(completion.choices[0].message.content)
             if parsed_prompt['get_rows'] != "":
                 json_object['get_rows'] = parsed_prompt['get_rows']
-            ok, error_message = validator.validate(json_object)
+            with span("oql-validation"):
+                ok, error_message = validator.validate(json_object)
             if 'show_columns' not in json_object:
                 ok = False
 
@@ -120,6 +155,7 @@ def get_openai_response(prompt):
         if ok:
             return json_object
         else:
+            OQL_ERRORS.labels("columns").inc()
             return (
                 jsonify(
                     {
@@ -145,17 +181,22 @@ def get_openai_response(prompt):
         while not ok:
             if i == 2:
                 break
-            completion = client.beta.chat.completions.parse(
-                model=openai_model_version,
-                messages=messages,
-                response_format=SortByColumnsObject,
-                temperature=0.2
-            )
-
+            if i > 0:
+                OQL_RETRIES.labels("sort-by").inc()
+            with span("oql-sort-by"), observe_upstream("openai-chat"):
+                completion = client.beta.chat.completions.parse(
+                    model=openai_model_version,
+                    messages=messages,
+                    response_format=SortByColumnsObject,
+                    temperature=0.2
+                )
+
+            record_token_usage("sort-by", completion.usage)
             json_object = json.loads(completion.choices[0].message.content)
             if parsed_prompt['get_rows'] != "":
                 json_object['get_rows'] = parsed_prompt['get_rows']
-            ok, error_message = validator.validate(json_object)
+            with span("oql-validation"):
+                ok, error_message = validator.validate(json_object)
             if ('sort_by_column' not in json_object) or ('sort_by_order' not in json_object):
                 ok = False
 
@@ -164,6 +205,7 @@ def get_openai_response(prompt):
         if ok:
             return json_object
         else:
+            OQL_ERRORS.labels("sort-by").inc()
             return (
                 jsonify(
                     {
@@ -190,16 +232,21 @@ def get_openai_response(prompt):
         while not ok:
             if i == 2:
                 break
-            completion = client.beta.chat.completions.parse(
-                model=openai_model_version,
-                messages=messages,
-                response_format=ReturnSortByColumnsObject,
-            )
-
+            if i > 0:
+                OQL_RETRIES.labels("sort-by-columns").inc()
+            with span("oql-sort-by-columns"), observe_upstream("openai-chat"):
+                completion = client.beta.chat.completions.parse(
+                    model=openai_model_version,
+                    messages=messages,
+                    response_format=ReturnSortByColumnsObject,
+                )
+
+            record_token_usage("sort-by-columns", completion.usage)
             json_object = json.loads(completion.choices[0].message.content)
             if parsed_prompt['get_rows'] != "":
                 json_object['get_rows'] = parsed_prompt['get_rows']
-            ok, error_message = validator.validate(json_object)
+            with span("oql-validation"):
+                ok, error_message = validator.validate(json_object)
             if not all(x in json_object.keys() for x in ['sort_by_column','sort_by_order', 
                                                          'show_columns']):
                 ok = False
@@ -209,6 +256,7 @@ def get_openai_response(prompt):
         if ok:
             return json_object
         else:
+            OQL_ERRORS.labels("sort-by-columns").inc()
             return (
                 jsonify(
                     {
@@ -237,14 +285,18 @@ def get_openai_response(prompt):
     while not ok:
         if i == 3:
             break
+        if i > 0:
+            OQL_RETRIES.labels("tool-choice").inc()
 
         # Getting the tool needed for looking up new query
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            tools=tools,
-            temperature=0.2
-        )
+        with span("oql-tool-choice"), observe_upstream("openai-chat"):
+            response = client.chat.completions.create(
+                model=openai_model_version,
+                messages=messages,
+                tools=tools,
+                temperature=0.2
+            )
+        record_token_usage("tool-choice", response.usage)
         if response.choices[0].message.tool_calls:
             # Getting institution IDs (if needed)
             # print(response.choices[0].message.tool_calls)
@@ -254,23 +306,27 @@ def get_openai_response(prompt):
             messages.append({"role": "assistant", "content": str(response.choices[0].message)})
             messages.append({"role": "user", "content": json.dumps(all_ids)})
 
-        completion = client.beta.chat.completions.parse(
-            model=openai_model_version,
-            messages=messages,
-            response_format=OQLJsonObject,
-            temperature=0.2
-        )
+        with span("oql-final"), observe_upstream("openai-chat"):
+            completion = client.beta.chat.completions.parse(
+                model=openai_model_version,
+                messages=messages,
+                response_format=OQLJsonObject,
+                temperature=0.2
+            )
+        record_token_usage("final", completion.usage)
         openai_json_object = json.loads(completion.choices[0].message.content)
 
         # print(openai_json_object)
 
         ok = True
-        ok, error_message = validator.validate(openai_json_object)
+        with span("oql-validation"):
+            ok, error_message = validator.validate(openai_json_object)
         messages.append({"role": "assistant", "content": str(completion.choices[0].message.content)})
         messages.append({"role": "user", "content": f"That was not correct. The following error message was received:\n{error_message}\n\nPlease try again."})
         i += 1
 
     if not ok:
+        OQL_ERRORS.labels("tool-choice").inc()
         return (jsonify(
                 {
                     "error": f"The model is having trouble generating a valid OQL JSON object. The latest error message received was '{error_message}'. Please try again."
@@ -280,10 +336,12 @@ def get_openai_response(prompt):
         )
     else:
         final_json_object = fix_output_for_final(openai_json_object, parsed_prompt)
-        final_val, final_error  = validator.validate(final_json_object)
+        with span("oql-validation"):
+            final_val, final_error  = validator.validate(final_json_object)
         if final_val:
             return final_json_object
         else:
+           OQL_ERRORS.labels("final").inc()
            return (jsonify(
                 {
                     "error": f"The model is having trouble generating a the final OQL JSON object. Getting the following message: {final_error}"
@@ -321,8 +379,52 @@ def quick_entity_check(prompt, oql_entities):
         return ""
 
 
-def messages_for_parse_prompt(oql_entities):
-    information_for_system = create_system_information(oql_entities)
+_prompt_prefixes = {}
+
+
+def get_prompt_prefixes(config):
+    """
+    The message prefixes of the parse and the chat prompts, as tuples the
+    requests extend with their own turns and never modify. They only
+    change with the entity config, so they are built once per config
+    version.
+    """
+    prefixes = _prompt_prefixes.get(config.version)
+    if prefixes is None:
+        information_for_system = create_system_information(config.value)
+        prefixes = (
+            tuple(messages_for_parse_prompt(information_for_system)),
+            tuple(example_messages_for_chat(information_for_system)),
+        )
+        # Earlier versions are never asked for again.
+        _prompt_prefixes.clear()
+        _prompt_prefixes[config.version] = prefixes
+    return prefixes
+
+
+def shared_prompt_head(information_for_system):
+    """
+    The opening messages of every OQL prompt. They hold the large entity
+    information and are byte-identical across stages and requests, so the
+    provider's prompt cache can serve them; everything that varies (the
+    stage's instructions and examples, the year, the user's request) comes
+    after them.
+    """
+    return [
+        {"role": "system",
+         "content": "You are helping to take in database search requests from users for pulling data from OpenAlex. OpenAlex indexes scholarly works and their metadata."},
+        {"role": "user", "content": information_for_system},
+        {"role": "assistant",
+         "content": "I will refer back to this information when handling the requests."},
+    ]
+
+
+def current_year_message():
+    return {"role": "user",
+            "content": f"The year is {datetime.datetime.now().year}. Please keep that in mind when responding."}
+
+
+def messages_for_parse_prompt(information_for_system):
 
     example_1 = "Show me all works in OpenAlex"
     example_1_answer = {
@@ -468,11 +570,9 @@ def messages_for_parse_prompt(oql_entities):
         }
 
     messages = [
+        *shared_prompt_head(information_for_system),
         {"role": "system", 
-         "content": "You are helping to take in database search requests from users and parse them into different parts."},
-        {"role": "user", "content": information_for_system},
-        {"role": "assistant", 
-         "content": "I will refer back to this information when determining the different elements of the prompt"},
+         "content": "Parse each of the following requests into its different parts."},
         {"role": "user","content": example_1}, 
         {"role": "user","content": json.dumps(example_1_answer)}, 
         {"role": "user","content": example_2}, 
@@ -607,193 +707,159 @@ def fix_output_for_final(old_json_object, parsed_prompt):
 #     json_object['filters'] = final_filter_obj
 #     return json_object 
 
-def get_institution_id(institution_name: str) -> str:
-    # Make a call to the API
-    api_call = f"https://api.openalex.org/institutions?search={institution_name}"
+def resolve_entity_id(entity_type, name):
+    """
+    The short ID of the best search match for a name, or None if there is
+    none. Answers, including "none", come from the name cache when it has
+    them; failed searches return None without being cached.
+    """
+    found, entity_id = entity_names.get(entity_type, name)
+    if found:
+        return entity_id
 
-    resp = requests.get(api_call)
+    # Make a call to the API
+    api_call = f"{upstream.OPENALEX_API_URL}/{entity_type}"
+
+    try:
+        # One attempt bounded by the tool deadline, so a search the request
+        # has given up on doesn't keep holding a tool thread.
+        resp = upstream.get(
+            api_call,
+            params={"search": name},
+            timeout=(min(upstream.CONNECT_TIMEOUT, OQL_TOOL_DEADLINE), OQL_TOOL_DEADLINE),
+            retries=False,
+        )
+    except requests.RequestException:
+        return None
 
-    if resp.status_code == 200:
-        resp_json = resp.json()
+    if resp.status_code != 200:
+        return None
 
-        if resp_json['meta']['count'] > 0:
-            return resp_json['results'][0]['id'].split("/")[-1]
-        else:
-            return 'institution not found'
-        
+    resp_json = resp.json()
+    if resp_json['meta']['count'] > 0:
+        entity_id = resp_json['results'][0]['id'].split("/")[-1]
     else:
-        return 'institution not found'
+        entity_id = None
+    entity_names.set(entity_type, name, entity_id)
+    return entity_id
+
+@timed("oql-tool-institution")
+def get_institution_id(institution_name: str) -> str:
+    institution_id = resolve_entity_id("institutions", institution_name)
+    return institution_id or 'institution not found'
     
+@timed("oql-tool-author")
 def get_author_id(author_name: str) -> str:
-    # Make a call to the API
-    api_call = f"https://api.openalex.org/authors?search={author_name}"
-
-    resp = requests.get(api_call)
-
-    if resp.status_code == 200:
-        resp_json = resp.json()
-
-        if resp_json['meta']['count'] > 0:
-            return resp_json['results'][0]['id'].split("/")[-1]
-        else:
-            return 'author not found'
-        
-    else:
-        return 'author not found'
+    author_id = resolve_entity_id("authors", author_name)
+    return author_id or 'author not found'
     
+@timed("oql-tool-keyword")
 def get_keyword_id(keyword_name: str) -> str:
-    # Make a call to the API
-    api_call = f"https://api.openalex.org/keywords?search={keyword_name}"
-
-    resp = requests.get(api_call)
-
-    if resp.status_code == 200:
-        resp_json = resp.json()
-
-        if resp_json['meta']['count'] > 0:
-            return resp_json['results'][0]['id'].split("/")[-1].lower()
-        else:
-            return 'keyword not found'
-        
-    else:
-        return 'keyword not found'
+    keyword_id = resolve_entity_id("keywords", keyword_name)
+    return keyword_id.lower() if keyword_id else 'keyword not found'
     
+@timed("oql-tool-source")
 def get_source_id(source_name: str) -> str:
-    # Make a call to the API
-    api_call = f"https://api.openalex.org/sources?search={source_name}"
-
-    resp = requests.get(api_call)
-
-    if resp.status_code == 200:
-        resp_json = resp.json()
-
-        if resp_json['meta']['count'] > 0:
-            return resp_json['results'][0]['id'].split("/")[-1].lower()
-        else:
-            return 'source not found'
-        
-    else:
-        return 'source not found'
+    source_id = resolve_entity_id("sources", source_name)
+    return source_id.lower() if source_id else 'source not found'
     
+@timed("oql-tool-funder")
 def get_funder_id(funder_name: str) -> str:
-    # Make a call to the API
-    api_call = f"https://api.openalex.org/funders?search={funder_name}"
-
-    resp = requests.get(api_call)
-
-    if resp.status_code == 200:
-        resp_json = resp.json()
-
-        if resp_json['meta']['count'] > 0:
-            return resp_json['results'][0]['id'].split("/")[-1].lower()
-        else:
-            return 'funder not found'
-        
-    else:
-        return 'funder not found'
-
+    funder_id = resolve_entity_id("funders", funder_name)
+    return funder_id.lower() if funder_id else 'funder not found'
+    
+@timed("oql-tool-publisher")
 def get_publisher_id(publisher_name: str) -> str:
-    # Make a call to the API
-    api_call = f"https://api.openalex.org/publishers?search={publisher_name}"
-
-    resp = requests.get(api_call)
-
-    if resp.status_code == 200:
-        resp_json = resp.json()
-
-        if resp_json['meta']['count'] > 0:
-            return resp_json['results'][0]['id'].split("/")[-1].lower()
-        else:
-            return 'publisher not found'
-        
-    else:
-        return 'publisher not found'
+    publisher_id = resolve_entity_id("publishers", publisher_name)
+    return publisher_id.lower() if publisher_id else 'publisher not found'
     
+@timed("oql-tool-topic")
 def get_topic_id(topic_name: str) -> str:
-    # Make a call to the API
-    api_call = f"https://api.openalex.org/topics?search={topic_name}"
-
-    resp = requests.get(api_call)
+    topic_id = resolve_entity_id("topics", topic_name)
+    return topic_id.lower() if topic_id else 'topic not found'
+    
+# tool name: (argument, lookup, what the lookup returns when nothing is found)
+TOOL_LOOKUPS = {
+    "get_institution_id": ("institution_name", get_institution_id, "institution not found"),
+    "get_author_id": ("author_name", get_author_id, "author not found"),
+    "get_keyword_id": ("search_name", get_keyword_id, "keyword not found"),
+    "get_source_id": ("search_name", get_source_id, "source not found"),
+    "get_funder_id": ("search_name", get_funder_id, "funder not found"),
+}
 
-    if resp.status_code == 200:
-        resp_json = resp.json()
 
-        if resp_json['meta']['count'] > 0:
-            return resp_json['results'][0]['id'].split("/")[-1].lower()
-        else:
-            return 'topic not found'
-        
-    else:
-        return 'topic not found'
-    
+@timed("oql-tool-lookups")
 def use_openai_output_to_get_ids(chat_response):
-    tool_calls = chat_response.choices[0].message.tool_calls
+    """
+    Run the model's tool calls (OpenAlex name searches) concurrently and
+    return their data in the order the model asked for them. Each call gets
+    its own thread, so every search starts straight away rather than queueing
+    behind other requests'; one that fails or isn't done within
+    OQL_TOOL_DEADLINE is answered as not found, so one slow search can't
+    stall the request.
+    """
+    tool_calls = [
+        (tool_call.function.name, json.loads(tool_call.function.arguments))
+        for tool_call in chat_response.choices[0].message.tool_calls
+        if tool_call.function.name in TOOL_LOOKUPS
+    ]
+    if not tool_calls:
+        return []
+
+    tool_executor = ThreadPoolExecutor(
+        max_workers=len(tool_calls), thread_name_prefix="oql-tools"
+    )
+    futures = []
+    for name, arguments in tool_calls:
+        argument, lookup, _ = TOOL_LOOKUPS[name]
+        futures.append(submit(tool_executor, lookup, arguments.get(argument)))
+    wait(futures, timeout=OQL_TOOL_DEADLINE)
+    # Searches still running finish on their own (their timeouts are bounded
+    # by the deadline too); nothing waits for them.
+    tool_executor.shutdown(wait=False)
 
     all_tool_data = []
-    for tool_call in tool_calls:
-        arguments = json.loads(tool_call.function.arguments)
-        
-        if tool_call.function.name == "get_institution_id":
-            institution_name = arguments.get('institution_name')
-        
-            institution_id = get_institution_id(institution_name)
-
-            all_tool_data.append({"raw_institution_name": institution_name, 
-                                    "authorships.institutions.id": f"institutions/{institution_id}", 
-                                    "institutions.id": f"institutions/{institution_id}"})
-        elif tool_call.function.name == "get_author_id":
-            author_name = arguments.get('author_name')
-        
-            author_id = get_author_id(author_name)
-
-            all_tool_data.append({"raw_author_name": author_name, 
-                                    "authorships.author.id": f"authors/{author_id}", 
-                                    "authors.id": f"authors/{author_id}"})
-        elif tool_call.function.name == "get_keyword_id":
-            search_name = arguments.get('search_name')
-        
-            keyword_id = get_keyword_id(search_name)
-
-            all_tool_data.append({"raw_search_name": search_name, 
-                                  "keywords.id": f"keywords/{keyword_id}"})
-            
-        elif tool_call.function.name == "get_source_id":
-            search_name = arguments.get('search_name')
-        
-            source_id = get_source_id(search_name)
-
-            all_tool_data.append({"raw_search_name": search_name, 
-                                  "primary_location.source.id": f"sources/{source_id}"})
-            
-        elif tool_call.function.name == "get_funder_id":
-            search_name = arguments.get('search_name')
-        
-            funder_id = get_funder_id(search_name)
-
-            all_tool_data.append({"raw_search_name": search_name, 
-                                  "grants.funder": f"funders/{funder_id}"})
-            
-        # elif tool_call.function.name == "get_publisher_id":
-        #     search_name = arguments.get('search_name')
-        
-        #     publisher_id = get_publisher_id(search_name)
+    for (name, arguments), future in zip(tool_calls, futures):
+        argument, _, not_found = TOOL_LOOKUPS[name]
+        if not future.done():
+            print(f"{name} timed out after {OQL_TOOL_DEADLINE}s")
+            entity_id = not_found
+        elif future.exception():
+            print(f"Error in {name}: {future.exception()}")
+            entity_id = not_found
+        else:
+            entity_id = future.result()
+        all_tool_data.append(tool_data(name, arguments.get(argument), entity_id))
+    return all_tool_data
 
-        #     all_tool_data.append({"raw_search_name": search_name, 
-        #                           "primary_location.source.publisher_lineage": f"publishers/{publisher_id}"})
-            
-        # elif tool_call.function.name == "get_topic_id":
-        #     search_name = arguments.get('search_name')
-        
-        #     topic_id = get_topic_id(search_name)
 
-        #     all_tool_data.append({"raw_search_name": search_name, 
-        #                           "primary_topic.id": f"topics/{topic_id}"})
-    return all_tool_data
+def tool_data(name, search_name, entity_id):
+    if name == "get_institution_id":
+        return {"raw_institution_name": search_name, 
+                "authorships.institutions.id": f"institutions/{entity_id}", 
+                "institutions.id": f"institutions/{entity_id}"}
+    elif name == "get_author_id":
+        return {"raw_author_name": search_name, 
+                "authorships.author.id": f"authors/{entity_id}", 
+                "authors.id": f"authors/{entity_id}"}
+    elif name == "get_keyword_id":
+        return {"raw_search_name": search_name, 
+                "keywords.id": f"keywords/{entity_id}"}
+    elif name == "get_source_id":
+        return {"raw_search_name": search_name, 
+                "primary_location.source.id": f"sources/{entity_id}"}
+    elif name == "get_funder_id":
+        return {"raw_search_name": search_name, 
+                "grants.funder": f"funders/{entity_id}"}
+    # elif name == "get_publisher_id":
+    #     return {"raw_search_name": search_name, 
+    #             "primary_location.source.publisher_lineage": f"publishers/{entity_id}"}
+    # elif name == "get_topic_id":
+    #     return {"raw_search_name": search_name, 
+    #             "primary_topic.id": f"topics/{entity_id}"}
 
 def create_system_information(entities_info):
-    # get current year
-    system_info = f"The year is {str(datetime.datetime.now().year)}. Please keep that in mind when responding.\n\n"
-    system_info += "If the name of an institution is given, use the get_institution_id tool in order to retrieve the OpenAlex institution ID.\n\n"
+    system_info = "If the name of an institution is given, use the get_institution_id tool in order to retrieve the OpenAlex institution ID.\n\n"
     system_info += "If the name of an author is given, use the get_author_id tool in order to retrieve the OpenAlex author ID.\n\n"
     system_info += "If the name of a keyword is given, use the get_keyword_id tool in order to retrieve the OpenAlex keyword ID.\n\n"
     system_info += "If the name of a source is given, use the get_source_id tool in order to retrieve the OpenAlex source ID.\n\n"
@@ -856,8 +922,7 @@ def create_system_information(entities_info):
             system_info += f"\n\n\n"
     return system_info.strip()
 
-def example_messages_for_chat(oql_entities):
-    information_for_system = create_system_information(oql_entities)
+def example_messages_for_chat(information_for_system):
 
     example_1 = "Just list all of the works in OpenAlex (also known as 'get works')"
     example_1_answer = json.dumps({
@@ -1108,11 +1173,9 @@ def example_messages_for_chat(oql_entities):
         })
 
     messages = [
+        *shared_prompt_head(information_for_system),
         {"role": "system",
-         "content": "You are helping to take in database search requests from users for pulling data from OpenAlex and turn them into a JSON object. OpenAlex indexes scholarly works and their metadata."},
-        {"role": "user", "content": information_for_system},
-        {"role": "assistant",
-         "content": "I will refer back to this information when determining which columns need to be filtered, sorted, or returned"},
+         "content": "Turn each of the following requests into a JSON object, determining which columns need to be filtered, sorted, or returned."},
          {"role": "user", "content": "If the name of an institution, author, keyword, source, funder, publisher, or topic is given, use the appropriate tool in order to retrieve the OpenAlex ID."},
         {"role": "assistant",
          "content": "I will make use of the tools to look up the IDs for the entities in the OpenAlex database."},
@@ -1284,13 +1347,50 @@ def get_tools():
     ]
     return tools
 
+# The parsed entity config is shared by every request in the process and
+# refreshed in the background every OQL_CONFIG_TTL seconds. Its last good
+# copy is kept on disk for workers that start while the API is down; set
+# OQL_CONFIG_CACHE_PATH to an empty string to keep it in memory only.
+OQL_CONFIG_TTL = int(os.getenv("OQL_CONFIG_TTL", 15 * 60))
+OQL_CONFIG_CACHE_PATH = os.getenv(
+    "OQL_CONFIG_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "openalex-text-oql-config.sqlite3"),
+)
+oql_config = RefreshingValue(
+    "oql-entities",
+    lambda: get_all_entities_and_columns(),  # defined below
+    OQL_CONFIG_TTL,
+    disk_cache=(
+        DiskCache(OQL_CONFIG_CACHE_PATH, "oql_config", 16, 30 * 24 * 60 * 60)
+        if OQL_CONFIG_CACHE_PATH
+        else None
+    ),
+)
+_oql_validator = None
+
+
+def get_oql_config():
+    """The current entity config Snapshot (version, value, loaded_at)."""
+    return oql_config.get()
+
+
+def get_oql_validator():
+    global _oql_validator
+    if _oql_validator is None:
+        _oql_validator = OQOValidator()
+    return _oql_validator
+
+
+@timed("oql-config")
 def get_all_entities_and_columns():
     entities_with_function_calling = ['institutions','authors','keywords','sources','funders','publishers','topics']
     entities_with_function_calling_not_set_up = ['concepts']
     entities_without_function_calling = ['continents', 'countries', 'domains','fields','institution-types','languages','licenses',
                                          'sdgs','source-types','subfields','types']
     
-    config_json = requests.get("https://api.openalex.org/entities/config").json()
+    r = upstream.get(f"{upstream.OPENALEX_API_URL}/entities/config")
+    r.raise_for_status()
+    config_json = r.json()
 
     oql_info = {}
     for key in config_json.keys():
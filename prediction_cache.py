@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import tempfile
+import unicodedata
+
+from disk_cache import DiskCache
+from singleflight import SingleFlight
+
+PREDICTION_CACHE_PATH = os.getenv(
+    "PREDICTION_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "openalex-text-predictions.sqlite3"),
+)
+PREDICTION_CACHE_MAX_ENTRIES = int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", 500_000))
+PREDICTION_CACHE_TTL = int(os.getenv("PREDICTION_CACHE_TTL", 7 * 24 * 60 * 60))
+
+# Set PREDICTION_CACHE_PATH to an empty string to turn the cache off.
+prediction_cache = (
+    DiskCache(
+        PREDICTION_CACHE_PATH,
+        "predictions",
+        PREDICTION_CACHE_MAX_ENTRIES,
+        PREDICTION_CACHE_TTL,
+    )
+    if PREDICTION_CACHE_PATH
+    else None
+)
+prediction_requests = SingleFlight("predictions")
+
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def canonical_text_hash(title, abstract, *extra):
+    # An abstract_inverted_index is hashed as is, key order aside; it is
+    # sent to the models as an index, so it never shares a key with text.
+    canonical = json.dumps(
+        [
+            normalize_text(title),
+            abstract if isinstance(abstract, dict) else normalize_text(abstract),
+            *extra,
+        ],
+        ensure_ascii=False,
+        separators=(",", ":"),
+        sort_keys=True,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def get_cached_predictions(model, documents, request_predictions):
+    """
+    Return one prediction list per document, only asking the model for the
+    documents that aren't cached. A document is (title, abstract, *extra),
+    where extra is any other model input such as the topic IDs the keywords
+    model takes, and `model` identifies the endpoint and its version.
+    request_predictions returns None for documents it failed to tag; those
+    come back as [] and are never cached. Concurrent requests for the same
+    uncached documents share one model call.
+    """
+    keys = [
+        canonical_text_hash(title, abstract, model, *extra)
+        for title, abstract, *extra in documents
+    ]
+    cached = prediction_cache.get_many(keys) if prediction_cache else {}
+
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    if missing:
+        missing_keys = tuple(keys[i] for i in missing)
+        fresh = prediction_requests.do(
+            missing_keys,
+            request_and_cache_predictions,
+            missing_keys,
+            [documents[i] for i in missing],
+            request_predictions,
+        )
+        cached.update(zip(missing_keys, fresh))
+
+    return [cached[key] if cached[key] is not None else [] for key in keys]
+
+
+def request_and_cache_predictions(keys, documents, request_predictions):
+    predictions = request_predictions(documents)
+    if prediction_cache:
+        prediction_cache.set_many(
+            {
+                key: prediction
+                for key, prediction in zip(keys, predictions)
+                if prediction is not None
+            }
+        )
+    return predictions
@@ -0,0 +1,189 @@
+"""
+Prediction backends for the tagging models. Each model is served either by
+its remote HTTP endpoint (the default) or in process by an exported ONNX
+model, picked per model through the environment:
+
+    TOPICS_PREDICTOR=local TOPICS_MODEL_PATH=/models/topics.onnx
+
+A local model takes a string tensor "text" of "title\\nabstract" per
+document, rebuilding abstracts given as inverted indexes (and, if the
+graph declares it, a string tensor "topics" of the space-separated topic
+IDs the keywords model conditions on), so the tokenizer has to be part of
+the exported graph. Its first output is a [documents, labels] score
+matrix; the label IDs come from the model's "labels" metadata, a JSON
+list. <NAME>_LOCAL_THRESHOLD and
+<NAME>_LOCAL_TOP_K control which scores are kept.
+
+onnxruntime is only needed, and only imported, for local models.
+"""
+import json
+import os
+import threading
+
+import requests
+
+from timing import span
+import upstream
+from utils import MODEL_BATCH_SIZE, abstract_text, chunks
+
+LOCAL_MODEL_THREADS = int(os.getenv("LOCAL_MODEL_THREADS", 0))
+
+
+class RemotePredictor:
+    """A model behind an HTTP endpoint taking a JSON batch of documents."""
+
+    def __init__(self, name, api_url, model_version, encode_request, parse_prediction):
+        self.name = name
+        self.api_url = api_url
+        # Identifies the predictions in the cache and in ETags.
+        self.model_id = f"{api_url}:{model_version}"
+        self.encode_request = encode_request
+        self.parse_prediction = parse_prediction
+
+    def predict(self, documents):
+        """One prediction per document, None for those it failed to tag."""
+        headers = {"X-API-Key": os.getenv("SAGEMAKER_API_KEY")}
+
+        predictions = []
+        for documents_chunk in chunks(documents, MODEL_BATCH_SIZE):
+            try:
+                with span(f"{self.name}-prediction"):
+                    r = upstream.post(
+                        self.api_url,
+                        name=f"sagemaker-{self.name}",
+                        json=self.encode_request(documents_chunk),
+                        headers=headers,
+                    )
+            except requests.RequestException as e:
+                print(f"Error tagging {self.name}: {e}")
+                predictions.extend(None for _ in documents_chunk)
+                continue
+
+            if r.status_code != 200:
+                print(f"Error tagging {self.name}: {r.status_code}")
+                predictions.extend(None for _ in documents_chunk)
+                continue
+
+            try:
+                response_data = r.json()
+            except ValueError as e:
+                print(f"Error tagging {self.name}: invalid JSON response: {e}")
+                predictions.extend(None for _ in documents_chunk)
+                continue
+            # Anything but one prediction per document can't be matched back
+            # to the documents, so none of it is used (or cached).
+            count = len(response_data) if isinstance(response_data, list) else None
+            if count != len(documents_chunk):
+                print(
+                    f"Error tagging {self.name}: {count} predictions "
+                    f"for {len(documents_chunk)} documents"
+                )
+                predictions.extend(None for _ in documents_chunk)
+                continue
+            predictions.extend(self.parse_prediction(resp_data) for resp_data in response_data)
+        return predictions
+
+    def load(self):
+        pass
+
+
+class LocalPredictor:
+    """An exported ONNX model run in process on the CPU."""
+
+    def __init__(self, name, model_path, model_version, format_prediction, threshold=0.0, top_k=None):
+        self.name = name
+        self.model_path = model_path
+        self.model_id = f"local:{os.path.basename(model_path)}:{model_version}"
+        self.format_prediction = format_prediction
+        self.threshold = threshold
+        self.top_k = top_k
+        self._session = None
+        self._labels = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load the model on first use; warm-up calls this ahead of time."""
+        with self._lock:
+            if self._session is None:
+                import onnxruntime
+
+                options = onnxruntime.SessionOptions()
+                if LOCAL_MODEL_THREADS:
+                    options.intra_op_num_threads = LOCAL_MODEL_THREADS
+                session = onnxruntime.InferenceSession(
+                    self.model_path, options, providers=["CPUExecutionProvider"]
+                )
+                metadata = session.get_modelmeta().custom_metadata_map
+                self._labels = json.loads(metadata["labels"])
+                self._session = session
+        return self._session
+
+    def predict(self, documents):
+        import numpy as np
+
+        session = self.load()
+        input_names = {model_input.name for model_input in session.get_inputs()}
+
+        predictions = []
+        for documents_chunk in chunks(documents, MODEL_BATCH_SIZE):
+            inputs = {
+                "text": np.array(
+                    [
+                        f"{title or ''}\n{abstract_text(abstract)}"
+                        for title, abstract, *_ in documents_chunk
+                    ],
+                    dtype=object,
+                )
+            }
+            if "topics" in input_names:
+                inputs["topics"] = np.array(
+                    [" ".join(map(str, extra[0])) for _, _, *extra in documents_chunk],
+                    dtype=object,
+                )
+
+            try:
+                with span(f"{self.name}-prediction"):
+                    scores = session.run(None, inputs)[0]
+            except Exception as e:
+                print(f"Error tagging {self.name}: {e}")
+                predictions.extend(None for _ in documents_chunk)
+                continue
+
+            predictions.extend(self.parse_scores(row) for row in scores)
+        return predictions
+
+    def parse_scores(self, row):
+        ranked = sorted(
+            (
+                (label, float(score))
+                for label, score in zip(self._labels, row)
+                if score > self.threshold
+            ),
+            key=lambda x: x[1],
+            reverse=True,
+        )
+        return [self.format_prediction(label, score) for label, score in ranked[: self.top_k]]
+
+
+def make_predictor(name, api_url, model_version, encode_request, parse_prediction, format_prediction):
+    """
+    The predictor configured for a model. encode_request and
+    parse_prediction adapt a batch to and each prediction from the remote
+    endpoint; format_prediction turns a local model's (label, score) into
+    the same shape.
+    """
+    prefix = name.upper()
+    backend = os.getenv(f"{prefix}_PREDICTOR", "remote")
+    if backend == "remote":
+        return RemotePredictor(name, api_url, model_version, encode_request, parse_prediction)
+    if backend == "local":
+        top_k = os.getenv(f"{prefix}_LOCAL_TOP_K")
+        return LocalPredictor(
+            name,
+            os.environ[f"{prefix}_MODEL_PATH"],
+            model_version,
+            format_prediction,
+            threshold=float(os.getenv(f"{prefix}_LOCAL_THRESHOLD", 0.0)),
+            top_k=int(top_k) if top_k else None,
+        )
+    raise ValueError(f"Unknown {prefix}_PREDICTOR: {backend}")
@@ -0,0 +1,87 @@
+"""
+A process-wide value built by a slow loader (an upstream fetch plus
+parsing) that is served from memory and refreshed in the background once
+it is older than a TTL: stale-while-revalidate. The last good copy is kept
+in a DiskCache, so a worker starts from it without waiting on the
+upstream, and keeps serving it while the upstream is slow or down.
+"""
+from collections import namedtuple
+import hashlib
+import json
+import os
+import threading
+import time
+
+Snapshot = namedtuple("Snapshot", ["version", "value", "loaded_at"])
+
+
+class RefreshingValue:
+    def __init__(self, name, load, ttl, retry_interval=60, disk_cache=None):
+        self.name = name
+        self.load = load
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.disk_cache = disk_cache
+        self._snapshot = None
+        self._next_refresh = 0
+        self._thread = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def get(self):
+        """The current Snapshot; only the very first calls may block on the loader."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            # Loaded without holding the lock, so a fork can never leave a
+            # child with it held by a thread that doesn't exist there;
+            # callers racing on a cold start may each load once.
+            loaded = self._read_disk() or self._load()
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = loaded
+                    self._next_refresh = loaded.loaded_at + self.ttl
+                snapshot = self._snapshot
+
+        if time.time() >= self._next_refresh:
+            self._start_refresh()
+        return snapshot
+
+    def refresh(self):
+        """Reload now; on failure keep serving the current value and retry later."""
+        try:
+            snapshot = self._load()
+        except Exception as e:
+            print(f"Error refreshing {self.name}: {e}")
+            self._next_refresh = time.time() + self.retry_interval
+            return
+        self._snapshot = snapshot
+        self._next_refresh = snapshot.loaded_at + self.ttl
+
+    def _load(self):
+        value = self.load()
+        canonical = json.dumps(value, sort_keys=True, separators=(",", ":"))
+        snapshot = Snapshot(
+            hashlib.sha256(canonical.encode()).hexdigest()[:16], value, time.time()
+        )
+        if self.disk_cache:
+            self.disk_cache.set(self.name, snapshot._asdict())
+        return snapshot
+
+    def _read_disk(self):
+        if not self.disk_cache:
+            return None
+        stored = self.disk_cache.get(self.name)
+        return Snapshot(**stored) if stored else None
+
+    def _start_refresh(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self.refresh, name=f"refresh-{self.name}", daemon=True
+            )
+            self._thread.start()
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._thread = None
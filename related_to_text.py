@@ -7,23 +7,27 @@ import tiktoken
 import psycopg2
 from urllib.parse import urlparse
 from pgvector.psycopg2 import register_vector
-from openai import OpenAI
 
-OPENAI_KEY = os.getenv("OPENAI_API_KEY")
+from metrics import observe_upstream
+from singleflight import coalesce
+from timing import span, timed
+import upstream
+
 EMBEDDING_MODEL = 'text-embedding-3-large'
 EMBEDDING_CTX_LENGTH = 8191
 EMBEDDING_ENCODING = 'cl100k_base'
-client = OpenAI(api_key= OPENAI_KEY)
 
+@timed("db-connect")
 def connect_to_db():
     secret = parse_postgres_connection_string()
-    conn = psycopg2.connect(
-        host=secret['host'],
-        port=secret['port'],
-        user=secret['username'],
-        password=secret['password'],
-        database=secret['dbname']
-    )
+    with observe_upstream("postgres-connect"):
+        conn = psycopg2.connect(
+            host=secret['host'],
+            port=secret['port'],
+            user=secret['username'],
+            password=secret['password'],
+            database=secret['dbname']
+        )
     return conn
 
 def parse_postgres_connection_string():
@@ -44,15 +48,19 @@ def truncate_text_tokens(text, encoding_name=EMBEDDING_ENCODING, max_tokens=EMBE
     encoding = tiktoken.get_encoding(encoding_name)
     return encoding.encode(text)[:max_tokens]
 
+@coalesce("embeddings", lambda text_to_embed: text_to_embed)
 def get_embedding(text_to_embed):
-    truncated_text = truncate_text_tokens(text_to_embed)
+    with span("tokenization"):
+        truncated_text = truncate_text_tokens(text_to_embed)
     
-    response = client.embeddings.create(
-            input=truncated_text,
-            model="text-embedding-3-large", 
-            dimensions=256,
-            
-        )
+    client = upstream.get_openai_client()
+    with span("embedding"), observe_upstream("openai-embeddings"):
+        response = client.embeddings.create(
+                input=truncated_text,
+                model="text-embedding-3-large", 
+                dimensions=256,
+                
+            )
     return np.array(response.data[0].embedding)
 
 def get_similar_works(conn, query_text, threshold, topK = 3):
@@ -61,9 +69,10 @@ def get_similar_works(conn, query_text, threshold, topK = 3):
     register_vector(conn)
     cur = conn.cursor()
     # Get the top K most similar works
-    cur.execute("SELECT work_id, (embedding <=> %s) as distance FROM mid.work_vector WHERE (embedding <=> %s) <= %s ORDER BY embedding <=> %s LIMIT %s", 
-                            (query_embedding,query_embedding,threshold, query_embedding,topK,))
-    top_works = cur.fetchall()
+    with span("sql"), observe_upstream("postgres"):
+        cur.execute("SELECT work_id, (embedding <=> %s) as distance FROM mid.work_vector WHERE (embedding <=> %s) <= %s ORDER BY embedding <=> %s LIMIT %s", 
+                                (query_embedding,query_embedding,threshold, query_embedding,topK,))
+        top_works = cur.fetchall()
     cur.close()
 
     return [{'work_id': x[0], 'score': round(1-x[1], 6)} for x in top_works]
@@ -74,8 +83,9 @@ def get_similar_authors(conn, query_text, threshold, topK = 3):
     register_vector(conn)
     cur = conn.cursor()
     # Get the top K most similar works
-    cur.execute("SELECT author_id, (embedding <=> %s) as distance FROM mid.author_vector WHERE (embedding <=> %s) <= %s ORDER BY embedding <=> %s LIMIT %s", 
-                            (query_embedding,query_embedding,threshold, query_embedding,topK,))
-    top_authors = cur.fetchall()
+    with span("sql"), observe_upstream("postgres"):
+        cur.execute("SELECT author_id, (embedding <=> %s) as distance FROM mid.author_vector WHERE (embedding <=> %s) <= %s ORDER BY embedding <=> %s LIMIT %s", 
+                                (query_embedding,query_embedding,threshold, query_embedding,topK,))
+        top_authors = cur.fetchall()
     cur.close()
     return [{'author_id': x[0], 'score': round(1-x[1], 6)} for x in top_authors]
\ No newline at end of file
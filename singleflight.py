@@ -0,0 +1,69 @@
+import functools
+import threading
+
+from metrics import COALESCED_CALLS
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key: the first caller runs the
+    function and every caller that arrives while it is in flight waits for
+    and gets the same result (or exception). Nothing is kept once the call
+    finishes, so this only collapses bursts; it is not a cache.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+                COALESCED_CALLS.labels(self.name).inc()
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+def coalesce(name, key_func):
+    """Decorator form of SingleFlight; key_func maps the call arguments to a key."""
+
+    def decorator(fn):
+        flight = SingleFlight(name)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return flight.do(key_func(*args, **kwargs), fn, *args, **kwargs)
+
+        wrapper.flight = flight
+        return wrapper
+
+    return decorator
@@ -0,0 +1,57 @@
+import threading
+
+import entities
+from entities import EntityCache
+
+
+def fake_api(calls):
+    def get_entities_from_api(entity_type, filter_name, entity_ids):
+        calls.append(list(entity_ids))
+        return [
+            {"id": f"https://openalex.org/{entity_id}", "display_name": entity_id}
+            for entity_id in entity_ids
+            if not entity_id.startswith("gone")
+        ]
+
+    return get_entities_from_api
+
+
+def test_missing_ids_are_cached_as_misses(monkeypatch):
+    calls = []
+    monkeypatch.setattr(entities, "get_entities_from_api", fake_api(calls))
+    cache = EntityCache("topics", "id")
+
+    assert [e["display_name"] for e in cache.get_many(["T1", "gone1"])] == ["T1"]
+    assert [e["display_name"] for e in cache.get_many(["T1", "gone1"])] == ["T1"]
+    assert calls == [["T1", "gone1"]]
+
+
+def test_size_is_bounded_by_evicting_the_least_recently_used(monkeypatch):
+    calls = []
+    monkeypatch.setattr(entities, "get_entities_from_api", fake_api(calls))
+    cache = EntityCache("topics", "id", max_entries=3)
+
+    cache.get_many(["T1", "T2", "T3"])
+    cache.get_many(["T1"])  # T2 is now the least recently used
+    cache.get_many(["gone1", "gone2"])
+    assert cache.stats()["size"] == 3
+
+    calls.clear()
+    cache.get_many(["T1", "T2"])
+    assert calls == [["T2"]]
+
+
+def test_concurrent_lookups_stay_bounded(monkeypatch):
+    monkeypatch.setattr(entities, "get_entities_from_api", fake_api([]))
+    cache = EntityCache("topics", "id", max_entries=50)
+
+    def look_up(thread):
+        for i in range(200):
+            cache.get_many([f"gone{thread}-{i}", f"T{i % 20}"])
+
+    threads = [threading.Thread(target=look_up, args=(thread,)) for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.stats()["size"] == 50
@@ -0,0 +1,44 @@
+from flask import Flask, jsonify
+
+import compress
+from http_cache import conditional
+
+
+def make_app():
+    app = Flask(__name__)
+    compress.init_app(app)
+
+    @app.route("/text/topics")
+    @conditional(lambda: ("A title", None), "model-1")
+    def topics():
+        return jsonify({"topics": ["x" * 100] * 50})
+
+    return app
+
+
+def test_gzip_200_and_304_share_etag_and_vary():
+    client = make_app().test_client()
+
+    ok = client.get("/text/topics", headers={"Accept-Encoding": "gzip"})
+    assert ok.status_code == 200
+    assert ok.headers["Content-Encoding"] == "gzip"
+    assert ok.headers["ETag"].startswith('W/"')
+    assert "Accept-Encoding" in ok.headers["Vary"]
+
+    not_modified = client.get(
+        "/text/topics",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": ok.headers["ETag"]},
+    )
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == ok.headers["ETag"]
+    assert "Accept-Encoding" in not_modified.headers["Vary"]
+
+
+def test_identity_200_has_the_same_etag():
+    client = make_app().test_client()
+
+    gzipped = client.get("/text/topics", headers={"Accept-Encoding": "gzip"})
+    identity = client.get("/text/topics", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in identity.headers
+    assert identity.headers["ETag"] == gzipped.headers["ETag"]
+    assert "Accept-Encoding" in identity.headers["Vary"]
@@ -0,0 +1,70 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("oqo_validate")
+import oql  # noqa: E402
+
+
+def chat_response(names):
+    tool_calls = [
+        SimpleNamespace(
+            function=SimpleNamespace(
+                name="get_institution_id",
+                arguments=json.dumps({"institution_name": name}),
+            )
+        )
+        for name in names
+    ]
+    message = SimpleNamespace(tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def slow_lookup(name):
+    time.sleep(0.3)
+    return f"i{name}"
+
+
+def test_more_calls_than_threads_all_resolve_within_the_deadline(monkeypatch):
+    monkeypatch.setattr(oql, "OQL_TOOL_DEADLINE", 1.0)
+    monkeypatch.setitem(
+        oql.TOOL_LOOKUPS,
+        "get_institution_id",
+        ("institution_name", slow_lookup, "institution not found"),
+    )
+    names = [str(i) for i in range(20)]
+
+    # Two requests at once, each with more searches than a small shared
+    # pool would run in parallel.
+    results = {}
+
+    def run(request):
+        results[request] = oql.use_openai_output_to_get_ids(chat_response(names))
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=run, args=(request,)) for request in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert time.monotonic() - start < 1.0
+    for tool_data in results.values():
+        assert [data["institutions.id"] for data in tool_data] == [
+            f"institutions/i{name}" for name in names
+        ]
+
+
+def test_a_search_past_the_deadline_is_not_found(monkeypatch):
+    monkeypatch.setattr(oql, "OQL_TOOL_DEADLINE", 0.1)
+    monkeypatch.setitem(
+        oql.TOOL_LOOKUPS,
+        "get_institution_id",
+        ("institution_name", slow_lookup, "institution not found"),
+    )
+
+    (tool_data,) = oql.use_openai_output_to_get_ids(chat_response(["Harvard"]))
+    assert tool_data["institutions.id"] == "institutions/institution not found"
@@ -0,0 +1,44 @@
+import json
+
+import requests
+
+import predictors
+from predictors import RemotePredictor
+
+
+def make_response(content, status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    return response
+
+
+def make_predictor(monkeypatch, response):
+    monkeypatch.setattr(predictors.upstream, "post", lambda *args, **kwargs: response)
+    return RemotePredictor(
+        "topics",
+        "http://sagemaker.test/topics",
+        "1",
+        encode_request=lambda documents: [{"title": title} for title, *_ in documents],
+        parse_prediction=lambda prediction: prediction["topics"],
+    )
+
+
+DOCUMENTS = [("First title", None), ("Second title", None), ("Third title", None)]
+
+
+def test_one_prediction_per_document(monkeypatch):
+    body = json.dumps([{"topics": [i]} for i in range(3)]).encode()
+    predictor = make_predictor(monkeypatch, make_response(body))
+    assert predictor.predict(DOCUMENTS) == [[0], [1], [2]]
+
+
+def test_wrong_number_of_predictions_fails_the_chunk(monkeypatch):
+    body = json.dumps([{"topics": [i]} for i in range(2)]).encode()
+    predictor = make_predictor(monkeypatch, make_response(body))
+    assert predictor.predict(DOCUMENTS) == [None, None, None]
+
+
+def test_non_json_response_fails_the_chunk(monkeypatch):
+    predictor = make_predictor(monkeypatch, make_response(b"<html>Bad gateway</html>"))
+    assert predictor.predict(DOCUMENTS) == [None, None, None]
@@ -0,0 +1,48 @@
+import os
+import threading
+import time
+
+from refreshing import RefreshingValue
+
+
+def test_the_lock_is_not_held_while_loading():
+    loading = threading.Event()
+    release = threading.Event()
+
+    def load():
+        loading.set()
+        release.wait(5)
+        return {"entities": 1}
+
+    value = RefreshingValue("config", load, ttl=60)
+    thread = threading.Thread(target=value.get)
+    thread.start()
+    assert loading.wait(5)
+    assert not value._lock.locked()
+    release.set()
+    thread.join()
+    assert value.get().value == {"entities": 1}
+
+
+def test_a_forked_child_gets_a_fresh_lock():
+    value = RefreshingValue("config", lambda: {"entities": 1}, ttl=60)
+    value._lock.acquire()  # as if a thread were holding it during the fork
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if value._lock.acquire(timeout=1) else 1)
+    _, status = os.waitpid(pid, 0)
+    value._lock.release()
+    assert os.waitstatus_to_exitcode(status) == 0
+
+
+def test_get_refreshes_in_the_background_once_stale():
+    loads = []
+
+    def load():
+        loads.append(time.monotonic())
+        return {"version": len(loads)}
+
+    value = RefreshingValue("config", load, ttl=0)
+    assert value.get().value == {"version": 1}
+    value._thread.join(5)
+    assert value.get().value == {"version": 2}
@@ -0,0 +1,27 @@
+from utils import get_work_title_and_abstract
+from validate import INVERTED_INDEX_ERROR, get_input_error, get_work_error
+
+TITLE = "Phosphates as Assisting Groups in Glycan Synthesis"
+
+
+def test_non_string_title():
+    assert get_input_error(5, None) == "The title must be a string"
+    assert get_input_error(["a title"], "An abstract") == "The title must be a string"
+
+
+def test_non_string_abstract():
+    assert get_input_error(TITLE, ["x"]) == "The abstract must be a string"
+
+
+def test_empty_abstract_does_not_hide_the_inverted_index():
+    work = {"title": TITLE, "abstract": "", "abstract_inverted_index": {"Sugars": [0]}}
+    assert get_work_title_and_abstract(work) == (TITLE, {"Sugars": [0]})
+    assert get_work_error(work) is None
+
+    work["abstract_inverted_index"] = {"Sugars": "first"}
+    assert get_work_error(work) == INVERTED_INDEX_ERROR
+
+
+def test_batch_work_types():
+    assert get_work_error({"title": 5}) == "The title and abstract must be strings"
+    assert get_work_error({"title": TITLE, "abstract": 5}) == "The title and abstract must be strings"
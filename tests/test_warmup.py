@@ -0,0 +1,37 @@
+import os
+
+import warmup
+
+
+def test_required_step_failures_hold_back_readiness_until_retried(monkeypatch):
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(warmup, "WARMUP_RETRY_INTERVAL", 0)
+    monkeypatch.setattr(warmup, "ROUTE_GROUPS", {"tagging"})
+    monkeypatch.setattr(
+        warmup,
+        "WARMUP_STEPS",
+        [("flaky", "tagging", flaky, True), ("optional", "tagging", lambda: 1 / 0, False)],
+    )
+    monkeypatch.setattr(warmup, "ready", warmup.threading.Event())
+
+    # Import-time warm-up (the gunicorn master) doesn't start the retries.
+    warmup.warm_up(retry=False)
+    assert not warmup.ready.is_set()
+    assert [name for name, _ in warmup.pending_steps] == ["flaky"]
+    assert warmup._retry_thread is None
+
+    # A forked worker does.
+    pid = os.fork()
+    if pid == 0:
+        warmup_ready = warmup.ready.wait(5)
+        os._exit(0 if warmup_ready and len(attempts) == 2 else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert not warmup.ready.is_set()
+    warmup.pending_steps.clear()
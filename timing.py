@@ -0,0 +1,110 @@
+"""
+Per-request latency breakdown. Code wraps each stage in `span(name)`; the
+spans of a request are returned in a Server-Timing header and written as
+one JSON log line when the request finishes.
+"""
+from contextlib import contextmanager
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+from flask import g, request
+
+TIMING_LOG = os.getenv("TIMING_LOG", "1") == "1"
+
+_current_timer = contextvars.ContextVar("request_timer", default=None)
+
+
+class RequestTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, duration):
+        with self._lock:
+            # Repeated stages (retries, one span per tool call) get numbered.
+            unique_name = name
+            i = 2
+            while unique_name in self.spans:
+                unique_name = f"{name}-{i}"
+                i += 1
+            self.spans[unique_name] = duration
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+
+@contextmanager
+def span(name):
+    timer = _current_timer.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.add(name, time.perf_counter() - start)
+
+
+def timed(name):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit that keeps recording spans into the calling request."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def server_timing_header(timer):
+    entries = [
+        f"{name};dur={duration * 1000:.1f}" for name, duration in timer.spans.items()
+    ]
+    entries.append(f"total;dur={timer.total() * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def start_timer():
+    g.request_timer = RequestTimer()
+    _current_timer.set(g.request_timer)
+
+
+def finish_timer(response):
+    timer = g.pop("request_timer", None)
+    if timer is None:
+        return response
+
+    response.headers["Server-Timing"] = server_timing_header(timer)
+    if TIMING_LOG:
+        print(
+            json.dumps(
+                {
+                    "method": request.method,
+                    "path": request.path,
+                    "endpoint": request.endpoint,
+                    "status": response.status_code,
+                    "total_ms": round(timer.total() * 1000, 1),
+                    "spans_ms": {
+                        name: round(duration * 1000, 1)
+                        for name, duration in timer.spans.items()
+                    },
+                }
+            ),
+            flush=True,
+        )
+    return response
+
+
+def init_app(app):
+    app.before_request(start_timer)
+    app.after_request(finish_timer)
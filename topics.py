@@ -1,52 +1,81 @@
-import functools
+from collections import OrderedDict
 import json
 import os
 
 from marshmallow import Schema, fields
-import requests
 
-from utils import format_score
+from entities import ENTITY_CACHES
+from prediction_cache import get_cached_predictions
+from predictors import make_predictor
+from timing import span
+from utils import index_by_id, join_scores
+
+
+TOPICS_API_URL = os.getenv(
+    "TOPICS_API_URL", "https://5gl84dua69.execute-api.us-east-1.amazonaws.com/api/"
+)
+TOPICS_MODEL_VERSION = os.getenv("TOPICS_MODEL_VERSION", "1")
 
 
-@functools.lru_cache(maxsize=64)
 def get_topic_predictions(title, abstract):
-    api_url = "https://5gl84dua69.execute-api.us-east-1.amazonaws.com/api/"
-    api_key = os.getenv("SAGEMAKER_API_KEY")
-    headers = {"X-API-Key": api_key}
-    data = {
-        "title": title,
-        "abstract_inverted_index": abstract,
-        "journal_display_name": "",
-        "referenced_works": [],
-        "inverted": False,
-    }
+    return get_topic_predictions_batch([(title, abstract)])[0]
+
 
-    r = requests.post(api_url, json=json.dumps([data], sort_keys=True), headers=headers)
-    if r.status_code == 200:
-        response_json = r.json()
-        resp_data = response_json[0]
-        return resp_data
-    else:
-        return []
+def get_topic_predictions_batch(documents):
+    return get_cached_predictions(
+        TOPICS_PREDICTOR.model_id, documents, TOPICS_PREDICTOR.predict
+    )
 
 
-def get_topics_from_api(topic_ids):
-    r = requests.get(
-        "https://api.openalex.org/topics?filter=id:{0}".format("|".join(topic_ids))
+def encode_topics_request(documents):
+    return json.dumps(
+        [
+            {
+                "title": title,
+                "abstract_inverted_index": abstract,
+                "journal_display_name": "",
+                "referenced_works": [],
+                "inverted": isinstance(abstract, dict),
+            }
+            for title, abstract in documents
+        ],
+        sort_keys=True,
     )
-    topics_from_api = r.json()["results"]
-    return topics_from_api
+
+
+TOPICS_PREDICTOR = make_predictor(
+    "topics",
+    TOPICS_API_URL,
+    TOPICS_MODEL_VERSION,
+    encode_topics_request,
+    lambda resp_data: resp_data,
+    lambda topic_id, score: {"topic_id": topic_id, "topic_score": score},
+)
+
+
+def get_topics_from_api(topic_ids):
+    with span("topics-hydration"):
+        return index_by_id(ENTITY_CACHES["topics"].get_many(topic_ids))
 
 
 def format_topics(topic_predictions, topics_from_api):
-    ordered_topics = []
-    for topic in topic_predictions:
-        for api_topic in topics_from_api:
-            if api_topic["id"] == f"https://openalex.org/T{topic['topic_id']}":
-                api_topic["score"] = format_score(topic["topic_score"])
-                ordered_topics.append(api_topic)
-                break
-    return ordered_topics
+    return join_scores(
+        (
+            (f"https://openalex.org/T{topic['topic_id']}", topic["topic_score"])
+            for topic in topic_predictions
+        ),
+        topics_from_api,
+    )
+
+
+def build_topics_result(formatted_topics):
+    result = OrderedDict()
+    result["meta"] = {
+        "count": len(formatted_topics),
+    }
+    result["primary_topic"] = formatted_topics[0] if formatted_topics else None
+    result["topics"] = formatted_topics
+    return result
 
 
 class TopicHierarchySchema(Schema):
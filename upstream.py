@@ -0,0 +1,127 @@
+"""
+Pooled, long-lived clients for every upstream: one keep-alive session per
+host (SageMaker, api.openalex.org) and retry policy, and one OpenAI client
+per process.
+"""
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import UPSTREAM_ERRORS, UPSTREAM_RETRIES, observe_upstream
+
+CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", 30))
+MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", 2))
+POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", 20))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", 60))
+OPENALEX_API_URL = os.getenv("OPENALEX_API_URL", "https://api.openalex.org")
+
+_sessions = {}
+_openai_client = None
+_lock = threading.Lock()
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def request(method, url, timeout=None, name=None, retries=True, **kwargs):
+    """
+    `name` labels the call in the upstream latency metrics; it defaults to
+    "openalex-<endpoint>" for the OpenAlex API and to the host otherwise.
+    retries=False makes a single attempt, for callers with a deadline.
+    """
+    name = name or upstream_name(url)
+    with observe_upstream(name):
+        r = get_session(url, retries).request(
+            method, url, timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs
+        )
+    if r.status_code == 429 or r.status_code >= 500:
+        UPSTREAM_ERRORS.labels(name).inc()
+    return r
+
+
+def upstream_name(url):
+    if url.startswith(OPENALEX_API_URL):
+        path = url[len(OPENALEX_API_URL):].split("?")[0].strip("/")
+        return "openalex-" + (path.split("/")[0] or "root")
+    return urlsplit(url).netloc
+
+
+def get_session(url, retries=True):
+    key = (urlsplit(url).netloc, retries)
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = create_session(
+                    MAX_RETRIES if retries else 0
+                )
+    return session
+
+
+class CountingRetry(Retry):
+    def increment(self, *args, **kwargs):
+        # Raises once retries are exhausted, so only real retries are counted.
+        new_retry = super().increment(*args, **kwargs)
+        pool = kwargs.get("_pool")
+        UPSTREAM_RETRIES.labels(pool.host if pool else "unknown").inc()
+        return new_retry
+
+
+def create_session(max_retries=MAX_RETRIES):
+    # Model inference and OpenAlex lookups are idempotent, so POSTs are
+    # retried as well as GETs.
+    retry = CountingRetry(
+        total=max_retries,
+        backoff_factor=0.2,
+        backoff_jitter=0.2,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_openai_client():
+    global _openai_client
+    if _openai_client is None:
+        with _lock:
+            if _openai_client is None:
+                from openai import OpenAI, Timeout
+
+                _openai_client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    timeout=Timeout(OPENAI_READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                    max_retries=MAX_RETRIES,
+                )
+    return _openai_client
+
+
+def reset_clients():
+    """
+    Drop pooled connections so a forked worker never shares sockets with its
+    parent; the clients are rebuilt lazily on first use.
+    """
+    global _openai_client, _lock
+    _sessions.clear()
+    _openai_client = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_clients)
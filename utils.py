@@ -1,28 +1,109 @@
+from collections import ChainMap
+import json
+import os
+
 from flask import request
 
+# Number of documents sent to a SageMaker model in a single call.
+MODEL_BATCH_SIZE = int(os.getenv("MODEL_BATCH_SIZE", 32))
+# Route groups this deployment serves, e.g. ROUTE_GROUPS=tagging for a lean
+# worker that never imports the OQL or embedding dependencies.
+ROUTE_GROUPS = set(os.getenv("ROUTE_GROUPS", "tagging,oql,related").split(","))
+
 
 def get_title_and_abstract():
-    if request.method == "GET":
+    if request.method in ("GET", "HEAD"):
         title = request.args.get("title")
         abstract = request.args.get("abstract")
-    else:
-        title = request.json.get("title")
-        abstract = request.json.get("abstract")
-    return title, abstract
+        if not abstract and "abstract_inverted_index" in request.args:
+            abstract = parse_inverted_index(request.args["abstract_inverted_index"])
+        return title, abstract
+    return get_work_title_and_abstract(request.json)
+
+def get_work_title_and_abstract(work):
+    """
+    The (title, abstract) of a work object. The abstract can instead be
+    given as an OpenAlex abstract_inverted_index ({word: [positions]}),
+    which is passed on to the models as is rather than turned into text.
+    An empty abstract counts as absent, so it doesn't hide the index.
+    """
+    abstract = work.get("abstract")
+    if abstract in (None, "") and work.get("abstract_inverted_index") is not None:
+        abstract = as_inverted_index(work["abstract_inverted_index"])
+    return work.get("title"), abstract
+
+def as_inverted_index(value):
+    # Anything but an object becomes False, which validation rejects, so it
+    # can't be mistaken for a plain-text abstract.
+    return value if isinstance(value, dict) else False
+
+def parse_inverted_index(value):
+    # A query string carries the index as JSON.
+    try:
+        return as_inverted_index(json.loads(value))
+    except ValueError:
+        return False
+
+def abstract_text(abstract):
+    """The abstract as text, rebuilding it from an inverted index."""
+    if isinstance(abstract, dict):
+        words = sorted(
+            (position, word)
+            for word, positions in abstract.items()
+            for position in positions
+        )
+        return " ".join(word for _, word in words)
+    return abstract or ""
+
+def get_batch_works():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return None
+    return body.get("works")
+
+def get_request_lines():
+    return request.stream
 
 def get_natural_language_text():
-    if request.method == "GET":
+    if request.method in ("GET", "HEAD"):
         natural_language_text = request.args.get("natural_language")
     else:
         natural_language_text = request.json.get("natural_language")
     return natural_language_text
 
 def get_related_to_text():
-    if request.method == "GET":
+    if request.method in ("GET", "HEAD"):
         text_input = request.args.get("text")
     else:
         text_input = request.json.get("text")
     return text_input
 
+def get_response_format():
+    if request.method in ("GET", "HEAD"):
+        response_format = request.args.get("format")
+    else:
+        response_format = (request.get_json(silent=True) or {}).get("format")
+    return response_format or "json"
+
 def format_score(score):
     return round(score, 3)
+
+def index_by_id(entities):
+    return {entity["id"]: entity for entity in entities}
+
+def join_scores(scored_ids, entities_by_id):
+    """
+    Pair (OpenAlex ID, score) predictions with their entity records, keeping
+    prediction order and dropping IDs without a record. The score is
+    overlaid with a ChainMap, so the shared, cached records are neither
+    copied nor mutated.
+    """
+    return [
+        ChainMap({"score": format_score(score)}, entities_by_id[entity_id])
+        for entity_id, score in scored_ids
+        if entity_id in entities_by_id
+    ]
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
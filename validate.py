@@ -1,37 +1,129 @@
+import os
+
 from flask import jsonify
 
+from utils import get_work_title_and_abstract
+
+BATCH_MAX_DOCUMENTS = int(os.getenv("BATCH_MAX_DOCUMENTS", 500))
+RESPONSE_FORMATS = ("json", "columnar", "msgpack")
+INVERTED_INDEX_ERROR = (
+    "The abstract_inverted_index must be an object mapping each word to a list of its positions"
+)
+
 
 def validate_input(title, abstract):
+    error = get_input_error(title, abstract)
+    if error:
+        return jsonify({"error": error}), 400
+    return None
+
+
+def get_input_error(title, abstract):
     combined_text_minimum = 20
     combined_text_limit = 2000
     if not title:
+        return (
+            "Add a title param or abstract param (optional) to get keywords, topics, etc. Example: "
+            "https://api.openalex.org/text?title=Phosphates%20as%20Assisting%20Groups%20in%20Glycan%20Synthesis"
+        )
+    if not isinstance(title, str):
+        return "The title must be a string"
+
+    if isinstance(abstract, dict):
+        error = get_inverted_index_error(abstract, combined_text_limit)
+        if error:
+            return error
+        abstract_length = inverted_index_text_length(abstract)
+    elif abstract is None or isinstance(abstract, str):
+        abstract_length = len(abstract or "")
+    elif abstract is False:
+        # What get_work_title_and_abstract makes of an inverted index that
+        # isn't an object.
+        return INVERTED_INDEX_ERROR
+    else:
+        return "The abstract must be a string"
+
+    combined_text_length = len(title) + 1 + abstract_length
+    if combined_text_length > combined_text_limit:
+        return f"The combined length of title and abstract must not exceed {combined_text_limit} characters"
+    elif combined_text_length < combined_text_minimum:
+        return f"The combined length of title and abstract must be at least {combined_text_minimum} characters"
+    return None
+
+
+def get_inverted_index_error(inverted_index, combined_text_limit):
+    for positions in inverted_index.values():
+        if not isinstance(positions, list) or not positions:
+            return INVERTED_INDEX_ERROR
+        for position in positions:
+            # Every word takes at least two characters of the text with its
+            # space, so no position of an abstract within the limit can be
+            # this large.
+            if (
+                not isinstance(position, int)
+                or isinstance(position, bool)
+                or not 0 <= position < combined_text_limit
+            ):
+                return INVERTED_INDEX_ERROR
+    return None
+
+
+def inverted_index_text_length(inverted_index):
+    """The length of the text an inverted index stands for, without building it."""
+    word_count = 0
+    length = 0
+    for word, positions in inverted_index.items():
+        word_count += len(positions)
+        length += len(word) * len(positions)
+    # Plus the spaces between the words.
+    return length + max(word_count - 1, 0)
+
+
+def validate_batch_input(works):
+    if not isinstance(works, list) or not works:
         return (
             jsonify(
                 {
-                    "error": "Add a title param or abstract param (optional) to get keywords, topics, etc. Example: "
-                    "https://api.openalex.org/text?title=Phosphates%20as%20Assisting%20Groups%20in%20Glycan%20Synthesis"
+                    "error": "POST a JSON body with a non-empty works list, e.g. "
+                    '{"works": [{"title": "...", "abstract": "..."}]}'
                 }
             ),
             400,
         )
 
-    abstract = abstract or ""
-
-    combined_text = title + " " + abstract
-    if len(combined_text) > combined_text_limit:
+    if len(works) > BATCH_MAX_DOCUMENTS:
         return (
             jsonify(
                 {
-                    "error": f"The combined length of title and abstract must not exceed {combined_text_limit} characters"
+                    "error": f"A batch must not contain more than {BATCH_MAX_DOCUMENTS} works"
                 }
             ),
             400,
         )
-    elif len(combined_text) < combined_text_minimum:
+
+    for i, work in enumerate(works):
+        error = get_work_error(work)
+        if error:
+            return jsonify({"error": f"works[{i}]: {error}"}), 400
+    return None
+
+
+def get_work_error(work):
+    if not isinstance(work, dict):
+        return "Each work must be an object with a title and an optional abstract"
+    title, abstract = get_work_title_and_abstract(work)
+    if not isinstance(title or "", str) or not isinstance(
+        work.get("abstract") or "", str
+    ):
+        return "The title and abstract must be strings"
+    return get_input_error(title, abstract)
+
+def validate_response_format(response_format):
+    if response_format not in RESPONSE_FORMATS:
         return (
             jsonify(
                 {
-                    "error": f"The combined length of title and abstract must be at least {combined_text_minimum} characters"
+                    "error": f"format must be one of: {', '.join(RESPONSE_FORMATS)}"
                 }
             ),
             400,
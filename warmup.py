@@ -0,0 +1,179 @@
+"""
+Warm-up of the shared, read-only state the first requests would otherwise
+build: the OQL entity config, prompt prefixes and validator, any local
+tagging models, the tiktoken BPE tables, the compiled response serializers
+and (with ENTITY_CACHE_PRELOAD) the entity metadata caches. It runs when
+the app is imported, so under `gunicorn --preload` it runs once in the
+master and the forked workers share the result copy-on-write. Without
+--preload, WARMUP=background runs it in a thread so the worker starts
+serving straight away. /ready answers 503 until every required step has
+succeeded; failed ones are retried in the background meanwhile.
+
+Only the steps of the enabled ROUTE_GROUPS run, so a tagging-only worker
+doesn't import the OQL or embedding dependencies here either. WARMUP=0
+skips it and marks the app ready straight away.
+"""
+import gc
+import os
+import threading
+import time
+
+from flask import jsonify
+
+from utils import ROUTE_GROUPS
+
+# "1" warms up while the app is imported, "background" in a thread once it
+# is serving (for workers that aren't preloaded), "0" not at all.
+WARMUP = os.getenv("WARMUP", "1")
+WARMUP_RETRY_INTERVAL = int(os.getenv("WARMUP_RETRY_INTERVAL", 10))
+
+ready = threading.Event()
+
+
+def warm_entity_caches():
+    from entities import preload_entity_caches
+
+    # e.g. ENTITY_CACHE_PRELOAD=topics,keywords,concepts
+    if os.getenv("ENTITY_CACHE_PRELOAD"):
+        preload_entity_caches(os.getenv("ENTITY_CACHE_PRELOAD").split(","))
+
+
+def warm_serializers():
+    from batch import BATCH_TAGGERS, STREAM_TAGGERS
+    from serialize import compile_schema
+
+    for _, message_schema_class in [*BATCH_TAGGERS.values(), *STREAM_TAGGERS.values()]:
+        compile_schema(message_schema_class)
+
+
+def warm_predictors():
+    from concepts import CONCEPTS_PREDICTOR
+    from keywords import KEYWORDS_PREDICTOR
+    from topics import TOPICS_PREDICTOR
+
+    # Loads local models; remote ones have nothing to load.
+    for predictor in (CONCEPTS_PREDICTOR, KEYWORDS_PREDICTOR, TOPICS_PREDICTOR):
+        predictor.load()
+
+
+def warm_oql():
+    from oql import get_oql_config, get_oql_validator, get_prompt_prefixes
+
+    get_prompt_prefixes(get_oql_config())
+    get_oql_validator()
+
+
+def warm_tokenizer():
+    import tiktoken
+
+    from related_to_text import EMBEDDING_ENCODING
+
+    tiktoken.get_encoding(EMBEDDING_ENCODING)
+
+
+# (name, route group, step, required): a required step's routes fail, rather
+# than just run slower, until it has succeeded.
+WARMUP_STEPS = [
+    ("entity-caches", "tagging", warm_entity_caches, False),
+    ("serializers", "tagging", warm_serializers, False),
+    ("predictors", "tagging", warm_predictors, True),
+    ("oql", "oql", warm_oql, True),
+    ("tokenizer", "related", warm_tokenizer, True),
+]
+
+# The required steps that have failed and are being retried.
+pending_steps = []
+_retry_thread = None
+_retry_lock = threading.Lock()
+
+
+def run_step(name, step):
+    step_start = time.monotonic()
+    try:
+        step()
+    except Exception as e:
+        print(f"Warm-up step {name} failed: {e}")
+        return False
+    print(f"Warm-up step {name} took {time.monotonic() - step_start:.2f}s")
+    return True
+
+
+def warm_up(retry=True):
+    """
+    Run the steps of the enabled route groups. Failed required steps are
+    retried in a background thread, started here if retry is set and
+    otherwise by the first /ready poll or in each forked worker.
+    """
+    start = time.monotonic()
+    failed = []
+    for name, group, step, required in WARMUP_STEPS:
+        if group not in ROUTE_GROUPS:
+            continue
+        # An optional step that fails is retried lazily by the first request
+        # that needs it, so it doesn't hold back readiness.
+        if not run_step(name, step) and required:
+            failed.append((name, step))
+
+    # Keep the garbage collector from touching (and so copying) every page
+    # of the warmed state in each forked worker.
+    gc.freeze()
+    print(f"Warm-up finished in {time.monotonic() - start:.2f}s")
+    if failed:
+        pending_steps[:] = failed
+        if retry:
+            start_retries()
+    else:
+        ready.set()
+
+
+def retry_pending_steps():
+    while pending_steps:
+        time.sleep(WARMUP_RETRY_INTERVAL)
+        pending_steps[:] = [
+            (name, step) for name, step in pending_steps if not run_step(name, step)
+        ]
+    ready.set()
+
+
+def start_retries():
+    global _retry_thread
+    with _retry_lock:
+        if _retry_thread is not None and _retry_thread.is_alive():
+            return
+        _retry_thread = threading.Thread(
+            target=retry_pending_steps, name="warm-up-retries", daemon=True
+        )
+        _retry_thread.start()
+
+
+def after_fork():
+    global _retry_thread, _retry_lock
+    _retry_thread = None
+    _retry_lock = threading.Lock()
+    if pending_steps:
+        start_retries()
+
+
+os.register_at_fork(after_in_child=after_fork)
+
+
+def ready_view():
+    if ready.is_set():
+        return jsonify({"ready": True})
+    if pending_steps:
+        start_retries()
+    return jsonify({"ready": False, "pending": [name for name, _ in pending_steps]}), 503
+
+
+def init_app(app):
+    app.add_url_rule("/ready", "ready", ready_view)
+    if WARMUP == "1":
+        # Under --preload this is the gunicorn master, which must not be
+        # making upstream calls from a thread while it forks workers: it
+        # could hand them locks held by a thread they don't have. Retries
+        # start in the workers instead.
+        warm_up(retry=False)
+    elif WARMUP == "background":
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    else:
+        ready.set()